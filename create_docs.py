@@ -175,8 +175,8 @@ bars = Group() \
         .intersection(flower)
 
 hexagons \
-        .filter(lambda g: flower.covers(g)) \
-        .filter(lambda g: not bars.intersects(g)) \
+        .filter_within(flower) \
+        .filter_disjoint(bars) \
         .add(bars) \
         .add(
                 flower.do_and_add(lambda f: f.buffer(10).add(f.buffer(15)))
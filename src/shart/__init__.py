@@ -7,7 +7,9 @@ import shapely as sh
 import shapely.affinity
 import shapely.geometry
 
-__all__ = [ "box", "coordinates", "group", "utils" ]
+from .cache import cached
+
+__all__ = [ "box", "cache", "cached", "coordinates", "group", "utils" ]
 
 
 
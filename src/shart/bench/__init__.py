@@ -0,0 +1,152 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import shapely as sh
+
+from shart.utils import coordinate_array
+
+from .scenarios import SCENARIOS
+
+# Benchmarks of the create_docs.py scenarios, see scenarios.py.
+#
+# Run with python -m shart.bench, which writes results as JSON and compares them
+# against a saved baseline. Each scenario is timed repeat times, keeping the fastest
+# run, then run once more under tracemalloc for its peak memory use, which only
+# counts python allocations (including numpy's, but not GEOS').
+#
+# The time taken to import shart.group in a new interpreter is measured as well, as
+# it's paid by every worker process.
+
+FORMAT_VERSION = 1
+
+# metrics compared against baselines, lower being better, with the absolute
+# differences below which they're considered noise
+TIMING_METRICS = {"seconds": 0.005, "peak_bytes": 64 * 1024}
+COUNT_METRICS = ["vertices", "parts"]
+IMPORT_NOISE_SECONDS = 0.02
+
+
+def run_scenario(name, scale=1, repeat=3):
+    if name not in SCENARIOS:
+        raise ValueError(f"Unknown scenario: {name}, expected one of: {', '.join(SCENARIOS)}")
+
+    if repeat < 1:
+        raise ValueError(f"Repeat must be at least 1: {repeat}")
+
+    function = SCENARIOS[name]
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(scale)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function(scale)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    geoms = result.geoms.geoms
+
+    return {
+        "seconds": min(times),
+        "mean_seconds": sum(times) / len(times),
+        "peak_bytes": peak_bytes,
+        "vertices": len(coordinate_array(geoms)[0]),
+        "parts": len(geoms)
+    }
+
+
+# runs the named scenarios (all by default), reporting each result to progress if given
+def run(names=None, scale=1, repeat=3, progress=None):
+    names = list(SCENARIOS) if names is None else names
+
+    results = dict()
+    for name in names:
+        results[name] = run_scenario(name, scale, repeat)
+
+        if progress is not None:
+            progress(name, results[name])
+
+    return {
+        "version": FORMAT_VERSION,
+        "scale": scale,
+        "repeat": repeat,
+        "import_seconds": import_seconds("shart.group", repeat),
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "numpy": np.__version__,
+            "shapely": sh.__version__,
+            "geos": "{}.{}.{}".format(*sh.geos.geos_version)
+        },
+        "results": results
+    }
+
+
+# fastest time taken to import module in a new interpreter, in seconds
+def import_seconds(module, repeat=3):
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+    # the interpreter's own path, so a source checkout imports the same shart
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+
+    return min(float(subprocess.run([sys.executable, "-c", code], env=environment, check=True,
+                                    capture_output=True, text=True).stdout)
+               for _ in range(max(1, repeat)))
+
+
+# returns (scenario, metric, baseline value, value) for each metric more than threshold
+# (relative) and more than noise worse than the baseline, and for each vertex or part
+# count that changed, which usually means the scenario's output changed
+def compare(results, baseline, threshold=0.1):
+    if results["scale"] != baseline["scale"]:
+        raise ValueError(f"Can't compare results of scale {results['scale']} to a baseline of scale {baseline['scale']}")
+
+    differences = []
+
+    if "import_seconds" in results and "import_seconds" in baseline:
+        if results["import_seconds"] > baseline["import_seconds"] * (1 + threshold) \
+                and results["import_seconds"] - baseline["import_seconds"] > IMPORT_NOISE_SECONDS:
+            differences.append(("import", "seconds", baseline["import_seconds"], results["import_seconds"]))
+
+    for name, result in results["results"].items():
+        baseline_result = baseline["results"].get(name, None)
+
+        if baseline_result is None:
+            continue
+
+        for metric, noise in TIMING_METRICS.items():
+            if result[metric] > baseline_result[metric] * (1 + threshold) \
+                    and result[metric] - baseline_result[metric] > noise:
+                differences.append((name, metric, baseline_result[metric], result[metric]))
+
+        for metric in COUNT_METRICS:
+            if result[metric] != baseline_result[metric]:
+                differences.append((name, metric, baseline_result[metric], result[metric]))
+
+    return differences
+
+
+def save(results, file_path):
+    with open(file_path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load(file_path):
+    with open(file_path, "r") as f:
+        results = json.load(f)
+
+    if results.get("version", None) != FORMAT_VERSION:
+        raise ValueError(f"Unsupported benchmark results version: {results.get('version', None)}")
+
+    return results
@@ -0,0 +1,41 @@
+import argparse
+import sys
+
+from . import SCENARIOS, compare, load, run, save
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m shart.bench", description="Benchmarks shart scenarios.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run, all by default: {', '.join(SCENARIOS)}")
+    parser.add_argument("--scale", type=int, default=1, help="size of the scenarios, 1 matching the documentation")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per scenario, the fastest is kept")
+    parser.add_argument("--output", help="file to write the results to, as JSON")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown or memory increase reported as a regression")
+    args = parser.parse_args(args)
+
+    def progress(name, result):
+        print(f"{name:<24}{result['seconds']:>10.3f}s{result['peak_bytes'] / 1024 / 1024:>10.1f}MB"
+              f"{result['vertices']:>10} vertices{result['parts']:>8} parts")
+
+    results = run(args.scenarios or None, args.scale, args.repeat, progress)
+    print(f"{'import shart.group':<24}{results['import_seconds']:>10.3f}s")
+
+    if args.output is not None:
+        save(results, args.output)
+
+    if args.baseline is not None:
+        differences = compare(results, load(args.baseline), args.threshold)
+
+        for name, metric, baseline_value, value in differences:
+            print(f"{name}: {metric} {baseline_value} -> {value}")
+
+        if len(differences) > 0:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
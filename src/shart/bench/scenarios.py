@@ -0,0 +1,118 @@
+import math
+
+import numpy as np
+import shapely as sh
+import shapely.geometry
+
+from shart.box import BoxFace, FingerGenerator
+from shart.group import Group
+from shart.line_generator import Turtle
+
+
+# Scaled versions of the scenarios in create_docs.py. Each scenario takes a scale,
+# 1 being the size used for the documentation, and returns the resulting Group.
+# Rendering and text are left out, so the scenarios only measure geometry and
+# don't need cairo.
+
+SCENARIOS = dict()
+
+
+def scenario(name):
+    def register(function):
+        SCENARIOS[name] = function
+        return function
+
+    return register
+
+
+@scenario("attributes-1")
+def attributes_1(scale):
+    c = Group.circle(0, 0, 100).add_geom_attribute("fill", True)
+    colors = [(1, 0, 0), (0, 1, 0, 0.5), (0, 0, 1, 0.75)]
+
+    return Group().add_all(
+        c.translate(70 * i, 0).add_geom_attribute("color", colors[i % len(colors)]) for i in range(3 * scale))
+
+
+@scenario("attributes-2")
+def attributes_2(scale):
+    ring = Group.circle(0, 0, 100).difference(Group.circle(0, 0, 50))\
+        .add_geom_attribute("fill", True)\
+        .add_geom_attribute("color", (1, 0, 0))
+
+    return ring.linarray(10 * scale, lambda i, g: g.translate(i * 120, 0))
+
+
+@scenario("hexagons-hard")
+def hexagons_hard(scale):
+    lattice_spacing = 10
+    row_count = 17 * scale
+    col_count = 17 * scale
+
+    def gen_row(row_number, g):
+        num_cols = col_count if row_number % 2 == 0 else col_count - 1
+
+        row_y = row_number * math.sqrt(3 / 4) * lattice_spacing
+        col_x = 0 if row_number % 2 == 0 else lattice_spacing / 2
+
+        return g.translate(col_x, row_y).linarray(num_cols, lambda i, g: g.translate(i * lattice_spacing, 0))
+
+    lattice = Group.circle(0, 0, 4).linarray(row_count, gen_row)
+    container = Group.circle(70 * scale, 70 * scale, 140 * scale)
+
+    return lattice.filter(lambda g: container.contains(g)).add(container)
+
+
+@scenario("recurse-tree")
+def recurse_tree(scale):
+    def branching_fractal_visitor(g):
+        scale = 0.5
+        angle = 10
+
+        top_right = g.geoms.geoms[0].boundary.coords[0]
+        top_left = g.geoms.geoms[0].boundary.coords[-2]
+        bottom_right = g.geoms.geoms[0].boundary.coords[1]
+        bottom_left = g.geoms.geoms[0].boundary.coords[2]
+
+        tl_br = tuple(np.subtract(bottom_right, top_left))
+        tr_bl = tuple(np.subtract(bottom_left, top_right))
+
+        subgroup1 = g.translate(tl_br[0], tl_br[1]) \
+            .scale(scale, origin=bottom_right) \
+            .rotate(angle, origin=bottom_right, use_radians=False)
+
+        subgroup2 = g.translate(tr_bl[0], tr_bl[1]) \
+            .scale(scale, origin=bottom_left) \
+            .rotate(-angle, origin=bottom_left, use_radians=False)
+
+        return [subgroup1, subgroup2]
+
+    # each extra level doubles the work
+    return Group.rect(0, 0, 100, 100).recurse(branching_fractal_visitor, 5 + scale)
+
+
+@scenario("turtle-fork")
+def turtle_fork(scale):
+    def forklength(depth):
+        return max(0.0, 50 * math.pow(2, -depth))
+
+    # each extra level triples the work
+    return Turtle(angle_rad=math.radians(-90)).move(100).fork(lambda d, instance: (
+        instance().turn_deg(-50).move(forklength(d)),
+        instance().turn_deg(-20).move(forklength(d)),
+        instance().turn_deg(30).move(forklength(d))), 3 + scale)\
+        .to_group()
+
+
+@scenario("finger-joint-phases")
+def finger_joint_phases(scale):
+    def create_for_phase(phase):
+        bf = BoxFace(sh.geometry.box(0, 0, 100, 20))
+        bf.assign_edge(2, FingerGenerator.create_for_length(100, 5, True, 6.5, 1, 0.1, duty=0.5, phase=phase))
+        bf.assign_edge(0, FingerGenerator.create_for_length(100, 5, False, 6.5, 1, 0.1, duty=0.5, phase=phase))
+
+        return bf.generate_group().union()
+
+    phases = np.linspace(0, 1, 10 * scale, endpoint=True)
+
+    return Group().add_all(create_for_phase(p).translate(0, i * 40) for i, p in enumerate(phases))
@@ -3,7 +3,7 @@ import math
 import shapely as sh
 import shapely.geometry
 
-from .group import Group
+from .group import Group, GroupBuilder
 
 
 # Generate mating halved joints with the specified clearance
@@ -69,16 +69,20 @@ class BoxFace:
 
         self._finger_generators[edge_index] = finger_generator
 
-    def generate_group(self):
-        result = Group.from_geomarray([ self._polygon ])
+    # if precision is set, the group is snapped to that grid, see Group.with_precision
+    def generate_group(self, precision=None):
+        result = GroupBuilder().add(Group.from_geomarray([ self._polygon ]))
 
         for index, edge in enumerate(self.edges):
             finger_generator = self._finger_generators.get(index, None)
 
             if finger_generator is not None:
-                result = result.add(finger_generator.get_fingers(edge))
+                result.add(finger_generator.get_fingers(edge))
 
-        return result
+        if precision is not None:
+            return result.build().with_precision(precision)
+
+        return result.build()
 
     @property
     def edges(self):
@@ -145,7 +149,7 @@ class FingerGenerator:
 
         edge_length = math.hypot(dx, dy)
 
-        result = Group()
+        result = GroupBuilder()
 
         intervals = self._interval_calculator.get_intervals(edge_length)
         for interval in intervals:
@@ -167,13 +171,13 @@ class FingerGenerator:
             box_length = box_end - box_start
 
             if box_length > self.kerf:
-                result = result.add(Group.rect(
+                result.add(Group.rect(
                     box_start,
                     0,
                     box_length,
                     -self.width - self.kerf / 2))
 
-        return result.translate(p1[0], p1[1]) \
+        return result.build().translate(p1[0], p1[1]) \
             .rotate(math.atan2(dy, dx), origin=p1)
 
     def get_slots(self, edge):
@@ -185,7 +189,7 @@ class FingerGenerator:
 
         edge_length = math.hypot(dx, dy)
 
-        result = Group()
+        result = GroupBuilder()
 
         intervals = self._interval_calculator.get_intervals(edge_length)
         for interval in intervals:
@@ -209,11 +213,11 @@ class FingerGenerator:
             if slot_length > self.kerf:
                 slot_width = self.width - self.kerf + self.clearance
 
-                result = result.add(Group.rect(
+                result.add(Group.rect(
                     slot_start,
                     0,
                     slot_length,
                     slot_width))
 
-        return result.translate(p1[0], p1[1]) \
+        return result.build().translate(p1[0], p1[1]) \
             .rotate(math.atan2(dy, dx), origin=p1)
@@ -0,0 +1,218 @@
+import functools
+import hashlib
+import os
+import tempfile
+import types
+
+import numpy as np
+
+
+# On-disk memoization of Group modifiers, see Group.do_cached and cached.
+#
+# Results are stored by a sha256 of the input group (see Group.to_bytes), the
+# modifier's code, constants and closure, any extra arguments and an optional
+# user supplied key. Functions the modifier calls are not part of the key, pass
+# key (e.g. a version number) to invalidate results when those change. Values which
+# can't be identified by their contents raise a ValueError.
+#
+# The cache directory is SHART_CACHE_DIR, by default ~/.cache/shart, and is limited
+# to SHART_CACHE_MAX_MB megabytes (1024 by default), least recently used results
+# being removed first.
+
+DEFAULT_MAX_MB = 1024
+
+
+class DiskCache:
+
+    def __init__(self, directory, max_bytes):
+        self._directory = directory
+        self._max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + ".shart")
+
+    def get(self, key):
+        path = self._path(key)
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        # modification times track use, for eviction. Another process may have evicted it since
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return data
+
+    def put(self, key, data):
+        os.makedirs(self._directory, exist_ok=True)
+
+        # written to a temporary file first so readers never see partial results
+        handle, temp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+
+        os.replace(temp_path, self._path(key))
+
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(".shart"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(e[1] for e in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+
+def default_cache():
+    directory = os.environ.get("SHART_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "shart"))
+    max_mb = float(os.environ.get("SHART_CACHE_MAX_MB", DEFAULT_MAX_MB))
+
+    return DiskCache(directory, int(max_mb * 1024 * 1024))
+
+
+# key for applying modifier to group, with the extra arguments
+def cache_key(group, modifier, args=(), kwargs=None, key=None):
+    digest = hashlib.sha256()
+
+    digest.update(group.to_bytes())
+    _update_digest(digest, modifier)
+    _update_digest(digest, args)
+    _update_digest(digest, sorted((kwargs or dict()).items()))
+    _update_digest(digest, key)
+
+    return digest.hexdigest()
+
+
+# modifier(group, *args, **kwargs), which must return a Group, loaded from the cache if possible
+def call_cached(group, modifier, args=(), kwargs=None, key=None, cache=None):
+    from .group import Group
+
+    if cache is None:
+        cache = default_cache()
+
+    kwargs = kwargs or dict()
+    result_key = cache_key(group, modifier, args, kwargs, key)
+
+    data = cache.get(result_key)
+    if data is not None:
+        return Group.from_bytes(data)
+
+    result = modifier(group, *args, **kwargs)
+
+    if not isinstance(result, Group):
+        raise ValueError(f"Cached modifiers must return a Group, instead: {type(result)}")
+
+    cache.put(result_key, result.to_bytes())
+
+    return result
+
+
+# Decorator caching a function whose first argument is a Group, as call_cached.
+# Can be used as @cached, or @cached(key=..., cache=...)
+def cached(function=None, key=None, cache=None):
+    if function is None:
+        return functools.partial(cached, key=key, cache=cache)
+
+    @functools.wraps(function)
+    def wrapper(group, *args, **kwargs):
+        return call_cached(group, function, args, kwargs, key, cache)
+
+    return wrapper
+
+
+def _update_digest(digest, value, seen=None):
+    from .group import Group
+
+    seen = seen if seen is not None else set()
+
+    # guards against functions referring to themselves through their closures
+    if isinstance(value, (types.FunctionType, types.MethodType, functools.partial)) or hasattr(value, "__dict__"):
+        if id(value) in seen:
+            digest.update(b"seen")
+            return
+
+        seen.add(id(value))
+
+    if isinstance(value, Group):
+        digest.update(b"group")
+        digest.update(value.to_bytes())
+    elif isinstance(value, functools.partial):
+        digest.update(b"partial")
+        _update_digest(digest, value.func, seen)
+        _update_digest(digest, value.args, seen)
+        _update_digest(digest, sorted(value.keywords.items()), seen)
+    elif isinstance(value, types.MethodType):
+        digest.update(b"method")
+        _update_digest(digest, value.__func__, seen)
+        _update_digest(digest, value.__self__, seen)
+    elif isinstance(value, types.FunctionType):
+        digest.update(b"function")
+        digest.update(f"{value.__module__}.{value.__qualname__}".encode("utf-8"))
+        _update_digest(digest, value.__code__, seen)
+        _update_digest(digest, value.__defaults__, seen)
+        _update_digest(digest, [c.cell_contents for c in value.__closure__ or ()], seen)
+    elif isinstance(value, types.CodeType):
+        digest.update(b"code")
+        digest.update(value.co_code)
+        digest.update(repr(value.co_names).encode("utf-8"))
+        _update_digest(digest, value.co_consts, seen)
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"sequence{len(value)}".encode("utf-8"))
+        for v in value:
+            _update_digest(digest, v, seen)
+    elif isinstance(value, dict):
+        _update_digest(digest, sorted(value.items(), key=repr), seen)
+    elif isinstance(value, (set, frozenset)):
+        digest.update(f"set{len(value)}".encode("utf-8"))
+        for element_digest in sorted(_digest_of(v, seen) for v in value):
+            digest.update(element_digest)
+    elif isinstance(value, (np.ndarray, np.generic)):
+        value = np.asarray(value)
+        digest.update(f"array{value.dtype.str}{value.shape}".encode("utf-8"))
+
+        if value.dtype.hasobject:
+            _update_digest(digest, value.tolist(), seen)
+        else:
+            digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, types.ModuleType):
+        digest.update(f"module{value.__name__}".encode("utf-8"))
+    elif isinstance(value, (type, types.BuiltinFunctionType)):
+        digest.update(f"named{value.__module__}.{value.__qualname__}".encode("utf-8"))
+
+        # builtin methods are bound to an object, e.g. [].append
+        if isinstance(value, types.BuiltinFunctionType):
+            _update_digest(digest, value.__self__, seen)
+    elif hasattr(value, "__dict__"):
+        # other callables and objects are identified by their type and state
+        digest.update(f"object{type(value).__module__}.{type(value).__qualname__}".encode("utf-8"))
+        _update_digest(digest, vars(value), seen)
+    elif value is None or value is Ellipsis or isinstance(value, (bool, int, float, complex, str, bytes)):
+        # their reprs are exact
+        digest.update(f"{type(value).__name__}{value!r}".encode("utf-8"))
+    else:
+        raise ValueError(f"Can't compute a cache key for {type(value)}, pass key= to identify it instead")
+
+
+def _digest_of(value, seen):
+    digest = hashlib.sha256()
+    _update_digest(digest, value, seen)
+
+    return digest.digest()
@@ -45,10 +45,7 @@ class Coordinates:
 
     @staticmethod
     def hex_covering(lattice_spacing, group, row_parity=None, column_parity=None):
-        x0 = group.geoms.bounds[0]
-        y0 = group.geoms.bounds[1]
-        x1 = group.geoms.bounds[2]
-        y1 = group.geoms.bounds[3]
+        x0, y0, x1, y1 = group.bounds
 
         width = x1 - x0
         height = y1 - y0
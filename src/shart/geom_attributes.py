@@ -1,7 +1,14 @@
-import copy
+import bisect
+import math
+
+import numpy as np
 
 
 # exists for performance reasons
+#
+# Attribute dicts handed out by GeomAttributesManager.shared_attributes are
+# shared with the immutable manager, so attribute dicts are replaced rather
+# than updated in place (copy on write).
 class MutableGeomAttributesManager:
 
     def __init__(self, existing_attributes=None):
@@ -25,82 +32,457 @@ class MutableGeomAttributesManager:
         del self.existing_attributes[index_from]
 
     def add_attribute(self, index, key, value):
-        attribute_dict = self.existing_attributes.setdefault(index, dict())
+        attribute_dict = dict(self.existing_attributes.get(index, ()))
         attribute_dict[key] = value
+        self.existing_attributes[index] = attribute_dict
 
     def add_attributes(self, index, attributes):
-        self.existing_attributes.setdefault(index, dict()).update(attributes)
+        attribute_dict = dict(self.existing_attributes.get(index, ()))
+        attribute_dict.update(attributes)
+        self.existing_attributes[index] = attribute_dict
+
+    # stores an attribute dict owned by an immutable manager without copying it
+    def add_shared_attributes(self, index, attributes):
+        if index in self.existing_attributes:
+            self.add_attributes(index, attributes)
+        else:
+            self.existing_attributes[index] = attributes
 
     def to_immutable(self):
-        return GeomAttributesManager(self.existing_attributes)
+        return GeomAttributesManager._shared(dict(self.existing_attributes))
 
     @staticmethod
     def copy(other):
-        return MutableGeomAttributesManager({k: v for k, v in other.attributes})
+        return MutableGeomAttributesManager(other._to_dict())
 
 
 class GeomAttributesManager:
 
     # Note: class should be immutable
+    #
+    # Attribute values are treated as immutable and the per-geom attribute
+    # dicts are never modified once stored, so managers share them instead of
+    # copying. offset_keys returns a view over the same storage.
     def __init__(self, existing_attributes=None):
         if existing_attributes is None:
             self._attributes = dict()
         else:
-            self._attributes = copy.deepcopy(existing_attributes)
+            self._attributes = {k: dict(v) for k, v in existing_attributes.items()}
+
+        self._offset = 0
+
+    @staticmethod
+    def _shared(attributes, offset=0):
+        result = GeomAttributesManager()
+        result._attributes = attributes
+        result._offset = offset
+
+        return result
+
+    def _to_dict(self):
+        if self._offset == 0:
+            return dict(self._attributes)
+
+        return {k + self._offset: v for k, v in self._attributes.items()}
+
+    def _is_empty(self):
+        return len(self._attributes) == 0
 
     @property
     def attributes(self):
+        for k, v in self.shared_attributes:
+            yield k, dict(v)
+
+    # as attributes, but yields the stored dicts themselves. These must not be modified.
+    @property
+    def shared_attributes(self):
         for k, v in self._attributes.items():
-            yield k, copy.deepcopy(v)
+            yield k + self._offset, v
 
     def union(self, other):
-        result_attributes = copy.deepcopy(self._attributes)
-        for k, v in other.attributes:
+        if other._is_empty():
+            return self
+        elif self._is_empty():
+            return other
+        elif isinstance(other, ColumnarGeomAttributesManager):
+            return ColumnarGeomAttributesManager.copy(self).union(other)
+
+        result_attributes = self._to_dict()
+        for k, v in other.shared_attributes:
             if k in result_attributes:
                 raise ValueError("Attribute key collision")
 
-            result_attributes[k] = copy.deepcopy(v)
+            result_attributes[k] = v
 
-        return GeomAttributesManager(result_attributes)
+        return GeomAttributesManager._shared(result_attributes)
 
     def offset_keys(self, offset):
-        result_attributes = dict()
-        for k, v in self._attributes.items():
-            result_attributes[k + offset] = copy.deepcopy(v)
+        if offset == 0:
+            return self
 
-        return GeomAttributesManager(result_attributes)
+        return GeomAttributesManager._shared(self._attributes, self._offset + offset)
 
     # extracts the supplied index and converts it to a zero indexed attribute
     def extract_index(self, geom_index):
-        return GeomAttributesManager(
-            existing_attributes={0: self.get_geom_attributes(geom_index)}
-        )
+        attributes = self._attributes.get(geom_index - self._offset)
+
+        return GeomAttributesManager._shared({} if attributes is None else {0: attributes})
+
+    # returns a manager where index j holds the attributes of geom_indices[j]
+    def select(self, geom_indices):
+        result = dict()
+        for i, geom_index in enumerate(geom_indices):
+            attributes = self._attributes.get(geom_index - self._offset)
+            if attributes is not None:
+                result[i] = attributes
+
+        return GeomAttributesManager._shared(result)
 
     def add_geom_attribute(self, geom_index, key, value):
-        new_attributes = copy.deepcopy(self._attributes)
-        if geom_index not in new_attributes:
-            new_attributes[geom_index] = dict()
+        return self.add_geom_attribute_for_indices([geom_index], key, value)
+
+    def add_geom_attribute_for_indices(self, geom_indices, key, value):
+        new_attributes = self._to_dict()
+
+        # geoms which shared an attribute dict before the update share the updated one too
+        updated = dict()
+        for geom_index in geom_indices:
+            existing = new_attributes.get(geom_index)
+            existing_id = id(existing)
 
-        new_attributes[geom_index][key] = value
+            if existing_id not in updated:
+                attribute_dict = dict(existing or ())
+                attribute_dict[key] = value
+                updated[existing_id] = attribute_dict
 
-        return GeomAttributesManager(new_attributes)
+            new_attributes[geom_index] = updated[existing_id]
+
+        return GeomAttributesManager._shared(new_attributes)
 
     def get_geom_attributes(self, geom_index):
-        return copy.deepcopy(self._attributes.get(geom_index, dict()))
+        return dict(self._attributes.get(geom_index - self._offset, ()))
+
+    def get_geom_attribute(self, geom_index, key, default=None):
+        return self._attributes.get(geom_index - self._offset, {}).get(key, default)
+
+    # yields the value of key for geom indices 0 to count - 1
+    def iter_geom_attribute(self, key, count, default=None):
+        for i in range(0, count):
+            yield self.get_geom_attribute(i, key, default)
 
     def move_geom_attributes(self, index_from, index_to):
-        if index_from not in self._attributes:
+        if index_from - self._offset not in self._attributes:
             return self # nothing to do
 
-        new_attributes = copy.deepcopy(self._attributes)
+        new_attributes = self._to_dict()
 
         if index_to in new_attributes:
             raise ValueError("Index already has attributes.")
 
-        new_attributes[index_to] = copy.deepcopy(new_attributes[index_from])
+        new_attributes[index_to] = new_attributes[index_from]
         del new_attributes[index_from]
 
-        return GeomAttributesManager(new_attributes)
+        return GeomAttributesManager._shared(new_attributes)
+
+
+_MISSING = object()
+
+
+def _same_value(a, b):
+    if a is b:
+        return True
+    elif type(a) is not type(b):
+        return False
+    elif isinstance(a, np.ndarray):
+        return a.dtype == b.dtype and np.array_equal(a, b)
+
+    try:
+        return bool(a == b)
+    except ValueError:
+        # e.g. tuples of arrays, whose comparison is ambiguous
+        return False
+
+
+# Values of a single attribute key for every geom index, stored as runs of
+# equal values. Run i covers indices [starts[i], starts[i + 1]), the first run
+# starts at -inf and the last run is unbounded. Should be treated as immutable.
+class RunLengthColumn:
+
+    def __init__(self, starts=None, values=None):
+        if starts is None:
+            self.starts = [-math.inf]
+            self.values = [_MISSING]
+        else:
+            self.starts, self.values = RunLengthColumn._normalize(starts, values)
+
+    @staticmethod
+    def _normalize(starts, values):
+        result_starts = []
+        result_values = []
+
+        for i, (start, value) in enumerate(zip(starts, values)):
+            if i + 1 < len(starts) and starts[i + 1] <= start:
+                continue  # empty run
+
+            if len(result_values) > 0 and _same_value(result_values[-1], value):
+                continue  # continuation of previous run
+
+            result_starts.append(start)
+            result_values.append(value)
+
+        return result_starts, result_values
+
+    # builds a column from (start, stop, value) runs, which must be sorted and disjoint
+    @staticmethod
+    def from_runs(runs):
+        starts = [-math.inf]
+        values = [_MISSING]
+
+        for start, stop, value in runs:
+            starts += [start, stop]
+            values += [value, _MISSING]
+
+        return RunLengthColumn(starts, values)
+
+    @staticmethod
+    def from_ranges(ranges, value):
+        return RunLengthColumn.from_runs((start, stop, value) for start, stop in ranges)
+
+    @property
+    def is_empty(self):
+        return all(v is _MISSING for v in self.values)
+
+    def get(self, index, default=_MISSING):
+        value = self.values[bisect.bisect_right(self.starts, index) - 1]
+
+        return default if value is _MISSING else value
+
+    # yields (start, stop, value) for each run with a value
+    def runs(self):
+        for i, value in enumerate(self.values):
+            if value is not _MISSING:
+                yield self.starts[i], self.starts[i + 1], value
+
+    def values_for(self, count, default=None):
+        for start, stop, value in self._runs_within(0, count):
+            value = default if value is _MISSING else value
+            for i in range(start, stop):
+                yield value
+
+    def _runs_within(self, range_start, range_stop):
+        run_index = bisect.bisect_right(self.starts, range_start) - 1
+        position = range_start
+
+        while position < range_stop:
+            run_stop = self.starts[run_index + 1] if run_index + 1 < len(self.starts) else range_stop
+            run_stop = min(run_stop, range_stop)
+
+            yield position, run_stop, self.values[run_index]
+
+            position = run_stop
+            run_index += 1
+
+    def assign(self, start, stop, value):
+        after_value = self.values[bisect.bisect_right(self.starts, stop) - 1]
+
+        before = [(s, v) for s, v in zip(self.starts, self.values) if s < start]
+        after = [(s, v) for s, v in zip(self.starts, self.values) if s > stop]
+
+        runs = before + [(start, value), (stop, after_value)] + after
+
+        return RunLengthColumn([s for s, v in runs], [v for s, v in runs])
+
+    # returns a column taking the values of other where other has a value
+    def overlay(self, other):
+        starts = sorted(set(self.starts) | set(other.starts))
+        values = []
+
+        for start in starts:
+            value = other.get(start)
+            values.append(self.get(start) if value is _MISSING else value)
+
+        return RunLengthColumn(starts, values)
+
+    def offset(self, offset):
+        return RunLengthColumn([s + offset for s in self.starts], self.values)
+
+    # returns a column where index j holds the value at indices[j]
+    def take(self, indices):
+        return RunLengthColumn(
+            [-math.inf] + list(range(0, len(indices))) + [len(indices)],
+            [_MISSING] + [self.get(i) for i in indices] + [_MISSING])
+
+
+# Stores attributes as one RunLengthColumn per key rather than a dict per geom,
+# so assigning a key to a whole group is a single run and groups where most
+# geoms share attribute values stay small.
+class ColumnarGeomAttributesManager(GeomAttributesManager):
+
+    def __init__(self, existing_attributes=None):
+        super().__init__()
+
+        items_by_key = dict()
+        for index, attributes in sorted((existing_attributes or dict()).items()):
+            for key, value in attributes.items():
+                items_by_key.setdefault(key, []).append((index, value))
+
+        self._columns = {
+            key: RunLengthColumn.from_runs((i, i + 1, v) for i, v in items)
+            for key, items in items_by_key.items()
+        }
+
+    @staticmethod
+    def _shared(columns):
+        result = ColumnarGeomAttributesManager()
+        result._columns = {k: c for k, c in columns.items() if not c.is_empty}
+
+        return result
+
+    @staticmethod
+    def copy(other):
+        if isinstance(other, ColumnarGeomAttributesManager):
+            return other
+
+        return ColumnarGeomAttributesManager(dict(other.shared_attributes))
+
+    # builds a manager from (key, (start, stop, value) runs) pairs, as returned by column_runs
+    @staticmethod
+    def from_column_runs(column_runs):
+        return ColumnarGeomAttributesManager._shared({
+            key: RunLengthColumn.from_runs(runs) for key, runs in column_runs
+        })
+
+    # (key, list of (start, stop, value) runs) for each attribute key
+    @property
+    def column_runs(self):
+        for key, column in self._columns.items():
+            yield key, list(column.runs())
+
+    # concatenates managers whose indices do not overlap
+    @staticmethod
+    def concatenate(managers):
+        runs_by_key = dict()
+
+        for manager in managers:
+            for key, column in ColumnarGeomAttributesManager.copy(manager)._columns.items():
+                runs_by_key.setdefault(key, []).extend(column.runs())
+
+        return ColumnarGeomAttributesManager._shared({
+            key: RunLengthColumn.from_runs(sorted(runs, key=lambda r: r[0]))
+            for key, runs in runs_by_key.items()
+        })
+
+    def _is_empty(self):
+        return len(self._columns) == 0
+
+    def _to_dict(self):
+        result = dict()
+
+        for key, column in self._columns.items():
+            for start, stop, value in column.runs():
+                for i in range(start, stop):
+                    result.setdefault(i, dict())[key] = value
+
+        return {k: result[k] for k in sorted(result)}
+
+    # merged [start, stop) ranges of indices with at least one attribute
+    def _occupied_ranges(self):
+        runs = sorted((start, stop) for c in self._columns.values() for start, stop, v in c.runs())
+
+        result = []
+        for start, stop in runs:
+            if len(result) > 0 and start <= result[-1][1]:
+                result[-1] = (result[-1][0], max(stop, result[-1][1]))
+            else:
+                result.append((start, stop))
+
+        return result
+
+    @property
+    def shared_attributes(self):
+        return iter(self._to_dict().items())
+
+    def union(self, other):
+        other = ColumnarGeomAttributesManager.copy(other)
+
+        if other._is_empty():
+            return self
+        elif self._is_empty():
+            return other
+
+        self_ranges = self._occupied_ranges()
+        for start, stop in other._occupied_ranges():
+            i = bisect.bisect_right(self_ranges, (start, math.inf)) - 1
+            if i >= 0 and self_ranges[i][1] > start or i + 1 < len(self_ranges) and self_ranges[i + 1][0] < stop:
+                raise ValueError("Attribute key collision")
+
+        columns = dict(self._columns)
+        for key, column in other._columns.items():
+            columns[key] = columns[key].overlay(column) if key in columns else column
+
+        return ColumnarGeomAttributesManager._shared(columns)
+
+    def offset_keys(self, offset):
+        if offset == 0:
+            return self
+
+        return ColumnarGeomAttributesManager._shared({k: c.offset(offset) for k, c in self._columns.items()})
+
+    def extract_index(self, geom_index):
+        return self.select([geom_index])
+
+    def select(self, geom_indices):
+        geom_indices = list(geom_indices)
+
+        return ColumnarGeomAttributesManager._shared({k: c.take(geom_indices) for k, c in self._columns.items()})
+
+    def add_geom_attribute_for_indices(self, geom_indices, key, value):
+        if isinstance(geom_indices, range) and geom_indices.step == 1:
+            ranges = [(geom_indices.start, geom_indices.stop)]
+        else:
+            ranges = [(i, i + 1) for i in sorted(set(geom_indices))]
+
+        update = RunLengthColumn.from_ranges(ranges, value)
+
+        columns = dict(self._columns)
+        columns[key] = columns[key].overlay(update) if key in columns else update
+
+        return ColumnarGeomAttributesManager._shared(columns)
 
     def get_geom_attributes(self, geom_index):
-        return self._attributes.get(geom_index, dict())
+        result = dict()
+
+        for key, column in self._columns.items():
+            value = column.get(geom_index)
+            if value is not _MISSING:
+                result[key] = value
+
+        return result
+
+    def get_geom_attribute(self, geom_index, key, default=None):
+        column = self._columns.get(key)
+
+        return default if column is None else column.get(geom_index, default)
+
+    def iter_geom_attribute(self, key, count, default=None):
+        column = self._columns.get(key)
+
+        if column is None:
+            return iter([default] * count)
+
+        return column.values_for(count, default)
+
+    def move_geom_attributes(self, index_from, index_to):
+        attributes = self.get_geom_attributes(index_from)
+
+        if len(attributes) == 0:
+            return self # nothing to do
+
+        if len(self.get_geom_attributes(index_to)) > 0:
+            raise ValueError("Index already has attributes.")
+
+        columns = {k: c.assign(index_from, index_from + 1, _MISSING) for k, c in self._columns.items()}
+        for key, value in attributes.items():
+            columns[key] = columns[key].assign(index_to, index_to + 1, value)
+
+        return ColumnarGeomAttributesManager._shared(columns)
@@ -1,3 +1,5 @@
+import functools
+import hashlib
 import math
 import sys
 
@@ -5,25 +7,51 @@ import shapely as sh
 import shapely.geometry
 import shapely.ops
 import shapely.affinity
+import shapely.prepared
 
-import cairo
-
+import shart.cache
 import shart.geom_attributes
-from .geom_attributes import GeomAttributesManager, MutableGeomAttributesManager
+from . import parallel
+from . import serialization
+from .profiling import profiled
+from .geom_attributes import GeomAttributesManager, MutableGeomAttributesManager, ColumnarGeomAttributesManager
 from .utils import *
 
 
 class Group:
 
     def __init__(self, geoms=None, geom_attributes_manager=None):
+        # affine transforms are accumulated here and only applied to the
+        # geometry once it is needed, see geoms
+        self._transform = None
+
+        # Group is immutable, so these are computed at most once
+        self._bounds_cache = None
+        self._centroid_cache = None
+        self._area_cache = None
+        self._spatial_index = None
+        self._prepared = None
+
+        # set instead of _geoms_value for views created by explode, which
+        # only build their multi geometry once it is needed
+        self._part = None
+
+        # (template geoms, array of affine matrices) for groups created by instance,
+        # which only build their multi geometry once it is needed
+        self._instances = None
+
+        # grid boolean ops snap to, and whether the geoms are already snapped to it, see with_precision
+        self._precision = None
+        self._on_grid = False
+
         if geoms is None:
-            self.geoms = sh.geometry.MultiPolygon([])
+            self._geoms_value = sh.geometry.MultiPolygon([])
             self.type = sh.geometry.MultiPolygon
         else:
             if not isinstance(geoms, sh.geometry.MultiPolygon) and not isinstance(geoms, sh.geometry.MultiLineString):
                 raise ValueError(f"Unsupported geom type: {geoms}")
 
-            self.geoms = geoms
+            self._geoms_value = geoms
             self.type = type(geoms)
 
         if geom_attributes_manager is None:
@@ -34,25 +62,253 @@ class Group:
         else:
             self.geom_attributes_manager = geom_attributes_manager
 
+    @property
+    def geoms(self):
+        if self._instances is not None:
+            self._geoms_value = self.type(_expand_instances(self._instances[0], self._instance_matrices()))
+            self._instances = None
+            self._transform = None
+        elif self._transform is not None:
+            if self._part is not None:
+                self._geoms_value = self.type([sh.affinity.affine_transform(self._part, self._transform)])
+                self._part = None
+            else:
+                self._geoms_value = sh.affinity.affine_transform(self._geoms_value, self._transform)
+
+            self._transform = None
+
+        return self._geoms
+
+    # the untransformed geometry
+    @property
+    def _geoms(self):
+        if self._part is not None:
+            self._geoms_value = self.type([self._part])
+            self._part = None
+        elif self._instances is not None:
+            self._geoms_value = self.type(_expand_instances(*self._instances))
+            self._instances = None
+
+        return self._geoms_value
+
+    # the untransformed geometry, or for views just their part, which has
+    # the same bounds and centroid
+    def _base(self):
+        return self._part if self._part is not None else self._geoms
+
+    def _is_empty(self):
+        # instanced groups are never empty, see instance
+        return self._instances is None and self._base().is_empty
+
+    # the transformed parts of this group, without building a multi geometry for views
+    def _parts(self):
+        if self._part is not None and self._transform is None:
+            return [self._part]
+
+        return list(self.geoms.geoms)
+
+    # a group with a single part of a parent group
+    @staticmethod
+    def _view(part, geom_type, geom_attributes_manager):
+        result = Group(None, geom_attributes_manager)
+        result._geoms_value = None
+        result._part = part
+        result.type = geom_type
+
+        return result
+
+    # returns a group sharing this group's untransformed geometry
+    def _shallow_copy(self, geom_attributes_manager):
+        result = Group(None, geom_attributes_manager)
+        result._geoms_value = self._geoms_value
+        result._part = self._part
+        result._instances = self._instances
+        result._precision = self._precision
+        result.type = self.type
+
+        return result
+
+    # a group holding the template geoms transformed by each matrix in turn
+    @staticmethod
+    def _instanced(template, matrices, geom_type, geom_attributes_manager):
+        result = Group(None, geom_attributes_manager)
+        result._geoms_value = None
+        result._instances = template, matrices
+        result.type = geom_type
+
+        return result
+
+    # the instance matrices, followed by any pending transform
+    def _instance_matrices(self):
+        matrices = self._instances[1]
+
+        if self._transform is None:
+            return matrices
+
+        return np.column_stack(compose_affine(matrices.T, self._transform))
+
+    # returns a group with the supplied matrix applied after any pending transform
+    def _with_transform(self, matrix, geom_attributes_manager):
+        result = self._shallow_copy(geom_attributes_manager)
+
+        if self._is_empty():
+            return result
+
+        result._transform = matrix if self._transform is None else compose_affine(self._transform, matrix)
+
+        # carry over cached measurements where the transform allows
+        if self._bounds_cache is not None and is_axis_aligned_affine(matrix):
+            result._bounds_cache = transform_bounds(matrix, self._bounds_cache)
+
+        if self._centroid_cache is not None and (self.type == sh.geometry.MultiPolygon or is_similarity_affine(matrix)):
+            result._centroid_cache = apply_affine(matrix, *self._centroid_cache)
+
+        if self._area_cache is not None:
+            result._area_cache = self._area_cache * abs(matrix[0] * matrix[3] - matrix[1] * matrix[2])
+
+        return result
+
+    def __getstate__(self):
+        # cached spatial indices can't be pickled, they are rebuilt on demand
+        state = dict(self.__dict__)
+        state["_spatial_index"] = None
+        state["_prepared"] = None
+
+        return state
+
+    # returns a group with the same (possibly untransformed) geometry and the supplied attributes
+    def _with_attributes(self, geom_attributes_manager):
+        result = self._shallow_copy(geom_attributes_manager)
+        result._on_grid = self._on_grid
+        result._transform = self._transform
+        result._bounds_cache = self._bounds_cache
+        result._centroid_cache = self._centroid_cache
+        result._area_cache = self._area_cache
+
+        if self._transform is None:
+            result._spatial_index = self._spatial_index
+            result._prepared = self._prepared
+
+        return result
+
+    # indices of the geoms whose envelopes intersect the supplied shapely geometry
+    def _query(self, geom):
+        return sorted(self._get_spatial_index()[0].query_items(geom))
+
+    # (STRtree, list of geoms), built on first use
+    def _get_spatial_index(self):
+        if self._spatial_index is None:
+            parts = list(self.geoms.geoms)
+            self._spatial_index = spatial_index(parts), parts
+
+        return self._spatial_index
+
+    # the geoms of this group which could interact with the supplied shapely geometry,
+    # as a single geometry, or None if there are none
+    def _query_geoms(self, geom):
+        parts = self._get_spatial_index()[1]
+        candidates = [parts[i] for i in self._query(geom)]
+
+        if len(candidates) == 0:
+            return None
+        elif len(candidates) == 1:
+            return candidates[0]
+        else:
+            return self.type(candidates)
+
+    # (min_x, min_y, max_x, max_y)
+    @property
+    def bounds(self):
+        if self._bounds_cache is None:
+            if self._instances is not None:
+                self._bounds_cache = instance_bounds(self._instances[0], self._instance_matrices())
+            elif self._transform is None or not is_axis_aligned_affine(self._transform):
+                self._bounds_cache = self.geoms.bounds
+            else:
+                self._bounds_cache = transform_bounds(self._transform, self._base().bounds)
+
+        return self._bounds_cache
+
+    # (x, y)
+    @property
+    def centroid(self):
+        if self._centroid_cache is None:
+            if self._instances is not None and self.type == sh.geometry.MultiPolygon and self.area > 0:
+                # the centroid of each copy weighted by its area, as shapely does for the expanded geoms
+                template_centroid = self.type(self._instances[0]).centroid
+                matrices = self._instance_matrices()
+
+                weights = np.abs(matrices[:, 0] * matrices[:, 3] - matrices[:, 1] * matrices[:, 2])
+                x, y = apply_affine(matrices.T, template_centroid.x, template_centroid.y)
+
+                self._centroid_cache = np.dot(weights, x) / weights.sum(), np.dot(weights, y) / weights.sum()
+            elif self._transform is None or \
+                    (not is_similarity_affine(self._transform) and self.type != sh.geometry.MultiPolygon):
+                centroid = self.geoms.centroid
+                self._centroid_cache = centroid.x, centroid.y
+            else:
+                # centroids of areas are preserved by any affine transform
+                centroid = self._base().centroid
+                self._centroid_cache = apply_affine(self._transform, centroid.x, centroid.y)
+
+        return self._centroid_cache
+
+    @property
+    def area(self):
+        if self._area_cache is None:
+            if self._instances is not None:
+                matrices = self._instance_matrices()
+                determinants = matrices[:, 0] * matrices[:, 3] - matrices[:, 1] * matrices[:, 2]
+
+                self._area_cache = self.type(self._instances[0]).area * np.abs(determinants).sum()
+            else:
+                self._area_cache = self.geoms.area
+
+        return self._area_cache
+
+    def _resolve_origin(self, origin):
+        if origin == 'center':
+            b = self.bounds
+            return (b[0] + b[2]) / 2, (b[1] + b[3]) / 2
+        elif origin == 'centroid':
+            return self.centroid
+        elif isinstance(origin, sh.geometry.Point):
+            return origin.x, origin.y
+        else:
+            return origin[0], origin[1]
+
+    # yields a view of each geom, sharing the geometry and attributes of this group
     def explode(self):
         for i, g in enumerate(self.geoms.geoms):
-            subgroup = Group(self.type([g]), self.geom_attributes_manager.extract_index(i))
-            yield subgroup
+            yield Group._view(g, self.type, self.geom_attributes_manager.extract_index(i))
+
+    # number of geoms, without applying transforms or expanding instances
+    def _part_count(self):
+        if self._instances is not None:
+            return len(self._instances[0]) * len(self._instances[1])
+        elif self._part is not None:
+            return 1
+
+        return len(self._geoms.geoms)
 
     def add_geom_attribute(self, key, value):
-        new_attrib_manager = self.geom_attributes_manager
-        for i, g in enumerate(self.geoms.geoms):
-            new_attrib_manager = new_attrib_manager.add_geom_attribute(i, key, value)
+        new_attrib_manager = self.geom_attributes_manager.add_geom_attribute_for_indices(
+            range(self._part_count()), key, value)
+
+        return self._with_attributes(new_attrib_manager)
 
-        return Group(self.geoms, new_attrib_manager)
+    # returns a copy of this group storing attributes per key rather than per
+    # geom, which is much more compact for large groups sharing attribute values
+    def with_columnar_attributes(self):
+        return self._with_attributes(ColumnarGeomAttributesManager.copy(self.geom_attributes_manager))
 
     @property
     def bounds_x(self):
-        return self.geoms.bounds[0]
+        return self.bounds[0]
 
     @property
     def bounds_y(self):
-        return self.geoms.bounds[1]
+        return self.bounds[1]
 
     @property
     def bounds_mid_x(self):
@@ -64,20 +320,21 @@ class Group:
 
     @property
     def bounds_width(self):
-        return self.geoms.bounds[2] - self.geoms.bounds[0]
+        bounds = self.bounds
+        return bounds[2] - bounds[0]
 
     @property
     def bounds_height(self):
-        return self.geoms.bounds[3] - self.geoms.bounds[1]
+        bounds = self.bounds
+        return bounds[3] - bounds[1]
 
     def anchor(self):
         # anchor is translation, which should preserve geom indices
-        anchored_geoms = anchor_geom(self.geoms)(self.geoms)
-
-        return Group(anchored_geoms, self.geom_attributes_manager)
+        return self.translate(-self.bounds_x, -self.bounds_y)
 
+    @profiled
     def border(self, border_thickness, border_radius):
-        border_geom = create_border_box(self.geoms, border_thickness, border_radius)
+        border_geom = border_box(self.bounds, border_thickness, border_radius)
 
         if self.type == sh.geometry.MultiLineString:
             border_geom = border_geom.boundary
@@ -87,24 +344,121 @@ class Group:
                 [g for g in self.geoms.geoms] + [border_geom]
             ), self.geom_attributes_manager)  # indices preserved as border is appended
 
+    @profiled
     def filter(self, predicate):
         filtered_geoms = []
-        filtered_gam = MutableGeomAttributesManager.copy(self.geom_attributes_manager)
+        filtered_indices = []
         for i, g in enumerate(self.geoms.geoms):
-            from_index = i
-
-            predicate_group = Group.from_geomarray([g], self.geom_attributes_manager.extract_index(i))
+            predicate_group = Group._view(g, self.type, self.geom_attributes_manager.extract_index(i))
 
             if predicate(predicate_group):
-                to_index = len(filtered_geoms)
-
-                # index of geom will change from i to len(filtered_geoms)
-                filtered_gam.move_geom_attributes(from_index, to_index)
                 filtered_geoms.append(g)
-            else:
-                filtered_gam.remove_geom_attributes(from_index)
+                filtered_indices.append(i)
+
+        return Group.from_geomarray(filtered_geoms, self.geom_attributes_manager.select(filtered_indices))
+
+    # prepared geometry of this group, built on first use
+    def _get_prepared(self):
+        if self._prepared is None:
+            self._prepared = sh.prepared.prep(self.geoms)
+
+        return self._prepared
+
+    def _filter_parts(self, predicate):
+        indices = [i for i, g in enumerate(self.geoms.geoms) if predicate(g)]
+        parts = self.geoms.geoms
+
+        return Group.from_geomarray([parts[i] for i in indices], self.geom_attributes_manager.select(indices))
+
+    # The filter_ methods below test each geom against the whole of the supplied
+    # group (rather than any single one of its geoms) using its cached prepared geometry.
+
+    # keeps geoms lying entirely inside group, touching its boundary is allowed
+    @profiled
+    def filter_within(self, group):
+        prepared = group._get_prepared()
+        return self._filter_parts(lambda g: prepared.covers(g))
+
+    @profiled
+    def filter_intersecting(self, group):
+        prepared = group._get_prepared()
+        return self._filter_parts(lambda g: prepared.intersects(g))
+
+    @profiled
+    def filter_disjoint(self, group):
+        prepared = group._get_prepared()
+        return self._filter_parts(lambda g: prepared.disjoint(g))
+
+    @profiled
+    def filter_by_area(self, min_area=None, max_area=None):
+        return self._filter_parts(
+            lambda g: (min_area is None or g.area >= min_area) and (max_area is None or g.area <= max_area))
+
+    # removes vertices which are within tolerance of the line through their neighbours,
+    # without changing topology, e.g. those finer than the output device can reproduce
+    @profiled
+    def simplify_for_output(self, tolerance):
+        if self._instances is not None:
+            template, matrices = self._instances
+
+            # the template is scaled by up to the largest norm of the matrices and the pending transform
+            norms = np.sqrt((self._instance_matrices()[:, :4] ** 2).sum(axis=1))
+            template_tolerance = tolerance / max(norms.max(), 1e-12)
+
+            simplified = [g.simplify(template_tolerance, preserve_topology=True) for g in template]
+            if not any(g.is_empty for g in simplified):
+                result = Group._instanced(simplified, matrices, self.type, self.geom_attributes_manager)
+                result._transform = self._transform
+
+                return result
+
+        simplified = [g.simplify(tolerance, preserve_topology=True) for g in self.geoms.geoms]
+        indices = [i for i, g in enumerate(simplified) if not g.is_empty]
+
+        return Group.from_geomarray([simplified[i] for i in indices], self.geom_attributes_manager.select(indices))
+
+    # keys of each geom of this group, with its attributes unless ignore_attributes is set
+    def _geom_keys(self, tolerance, ignore_attributes):
+        attributes = dict() if ignore_attributes else dict(self.geom_attributes_manager.shared_attributes)
+
+        for i, g in enumerate(self.geoms.geoms):
+            key = geom_key(g, tolerance)
+
+            # geoms with empty attributes are keyed the same as those without
+            if attributes.get(i):
+                key += repr(sorted(attributes[i].items(), key=repr)).encode("utf-8")
+
+            yield key
 
-        return Group.from_geomarray(filtered_geoms, filtered_gam.to_immutable())
+    # hash of the geoms and attributes of this group, with coordinates rounded to multiples
+    # of tolerance, see utils.geom_key. Stable across runs and platforms.
+    def content_hash(self, tolerance=1e-6):
+        digest = hashlib.sha256(self.type.__name__.encode("utf-8"))
+
+        for key in self._geom_keys(tolerance, False):
+            digest.update(len(key).to_bytes(8, "little"))
+            digest.update(key)
+
+        return digest.hexdigest()
+
+    # drops geoms which are the same as an earlier geom, within tolerance (see content_hash),
+    # and have the same attributes unless ignore_attributes is set
+    @profiled
+    def dedupe(self, tolerance=1e-6, ignore_attributes=False):
+        seen = set()
+        indices = []
+
+        for i, key in enumerate(self._geom_keys(tolerance, ignore_attributes)):
+            if key not in seen:
+                seen.add(key)
+                indices.append(i)
+
+        if len(indices) == len(self.geoms.geoms):
+            return self
+
+        parts = self.geoms.geoms
+
+        return Group.from_geomarray([parts[i] for i in indices], self.geom_attributes_manager.select(indices))
 
     def do_and_add(self, modifier):
         return self.add(modifier(self))
@@ -112,11 +466,18 @@ class Group:
     def do(self, modifier):
         return modifier(self)
 
+    # as do, but the result is stored on disk and reused when the same modifier is next
+    # applied to an identical group, see cache. modifier must return a Group
+    @profiled
+    def do_cached(self, modifier, key=None, cache=None):
+        return shart.cache.call_cached(self, modifier, key=key, cache=cache)
+
+    # results are added as they are produced, so only the combined result is held in memory
+    @profiled
     def map_subgroups(self, modifier):
-        return Group().add_all(
-            [modifier(g) for g in self.explode()]
-        )
+        return Group().add_all(modifier(g) for g in self.explode())
 
+    @profiled
     def add(self, group):
         if not isinstance(group, Group):
             raise ValueError("Added group is of wrong type.")
@@ -125,59 +486,147 @@ class Group:
         gam = self.geom_attributes_manager.union(
             group.geom_attributes_manager.offset_keys(len(self.geoms.geoms)))
 
-        return Group(self.type(geom_array), gam)
+        return self._keeping_precision(Group(self.type(geom_array), gam))
 
+    @profiled
     def add_all(self, groups):
-        result_geomarray = [g for g in self.geoms.geoms]
-        result_attributes = MutableGeomAttributesManager.copy(self.geom_attributes_manager)
-        key_index_offset = len(result_geomarray)
+        return self._keeping_precision(GroupBuilder().add(self).add_all(groups).build())
 
-        for g in groups:
-            result_geomarray += [geom for geom in g.geoms.geoms]
-            for k, v in g.geom_attributes_manager.attributes:
-                result_attributes.add_attributes(k + key_index_offset, v)
-            key_index_offset += len(g.geoms.geoms)
+    # the supplied group, with this group's precision grid (see with_precision)
+    def _keeping_precision(self, group):
+        group._precision = self._precision
+        return group
+
+    # Returns this group with its coordinates snapped to multiples of grid, repairing
+    # geoms this makes invalid. Boolean ops on the result, and on groups derived from it
+    # by transforms, snap both of their inputs and their output to the same grid, which
+    # avoids slivers from nearly coincident edges. A grid of None removes the precision.
+    @profiled
+    def with_precision(self, grid):
+        if grid is None:
+            result = self._with_attributes(self.geom_attributes_manager)
+            result._precision = None
+
+            return result
+
+        if grid <= 0:
+            raise ValueError(f"Precision grid must be positive: {grid}")
+
+        gam = self.geom_attributes_manager
+        snapped = snap_to_grid(list(self.geoms.geoms), grid)
+
+        if all(len(parts) == 1 for parts in snapped):
+            result = Group(self.type([parts[0] for parts in snapped]), gam)
+        else:
+            builder = GroupBuilder(self.type, columnar=isinstance(gam, ColumnarGeomAttributesManager))
 
-        return Group(self.type(result_geomarray), result_attributes.to_immutable())
+            for i, parts in enumerate(snapped):
+                builder.add_geoms(parts, gam.get_geom_attributes(i))
 
-    def intersection(self, group):
-        intersections = (g.intersection(group.geoms) for g in self.geoms.geoms)
+            result = builder.build()
+
+        result._precision = grid
+        result._on_grid = True
+
+        return result
+
+    # this group, snapped to grid unless it already is
+    def _snapped_to(self, grid):
+        if self._precision == grid and self._on_grid:
+            return self
+
+        return self.with_precision(grid)
+
+    # applies a boolean op to this group and any group argument snapped to this
+    # group's precision grid, then snaps the result
+    def _precise(self, operation, group, *args):
+        grid = self._precision
+
+        inputs = self._snapped_to(grid).with_precision(None)
+        if isinstance(group, Group):
+            group = group._snapped_to(grid)
+
+        return operation(inputs, group, *args).with_precision(grid)
+
+    # if workers is set, parts are processed in that many worker processes
+    @profiled
+    def intersection(self, group, workers=None):
+        if self._precision is not None:
+            return self._precise(Group.intersection, group, workers)
+
+        intersections = [i for r in self._map_parts(_intersection_parts, group, workers) for i in r]
 
         if self.type == sh.geometry.MultiPolygon:
             # possible line intersections. these should be filtered out
-            intersections = (i for i in intersections if i.type == "Polygon")
+            intersections = [i for i in intersections if i.type == "Polygon"]
 
-        return Group.from_geomarray(list(intersections))
+        return Group.from_geomarray(intersections)
 
-    def difference(self, group):
-        result = Group(self.type([]))
+    # if workers is set, parts are processed in that many worker processes
+    @profiled
+    def difference(self, group, workers=None):
+        if self._precision is not None:
+            return self._precise(Group.difference, group, workers)
 
-        for i, g in enumerate(self.geoms.geoms):
-            g_diff = flatten_geoms([g.difference(group.geoms)])
+        result = GroupBuilder(
+            self.type, columnar=isinstance(self.geom_attributes_manager, ColumnarGeomAttributesManager))
 
+        for i, g_diff in enumerate(self._map_parts(_difference_parts, group, workers)):
             if len(g_diff) > 0:
-                geom_attributes = self.geom_attributes_manager.get_geom_attributes(i)
-                diff_group = Group(self.type(g_diff), GeomAttributesManager({0: geom_attributes}))
-                result = result.add(diff_group)
+                result.add_geoms(g_diff, self.geom_attributes_manager.get_geom_attributes(i))
 
-        return result
+        return result.build()
+
+    # applies function(parts, argument) to this groups parts, in a process pool if workers is set
+    def _map_parts(self, function, argument, workers):
+        parts = list(self.geoms.geoms)
+
+        if workers is None or workers <= 1:
+            return function(parts, argument)
+
+        return parallel.map_geoms(function, parts, workers, argument)
+
+    # If attribute_key is set, geoms are unioned separately for each value of that
+    # attribute so that e.g. differently coloured geoms keep their colour. The
+    # attributes of unioned geoms are merged. If workers is set, geoms are
+    # unioned in spatial tiles using that many worker processes.
+    @profiled
+    def union(self, geom=None, attribute_key=None, workers=None):
+        if self._precision is not None:
+            return self._precise(Group.union, geom, attribute_key, workers)
 
-    def union(self, geom=None):
         if geom is None:
-            union = flatten_geoms([sh.ops.unary_union([g for g in self.geoms.geoms])])
-            combined_attributes = dict()
+            gam = self.geom_attributes_manager
+            parts = list(self.geoms.geoms)
+
+            classes = dict()
+            for i, value in enumerate(gam.iter_geom_attribute(attribute_key, len(parts))):
+                classes.setdefault(_hashable(value, attribute_key) if attribute_key is not None else None, []).append(i)
+
+            if len(classes) == 0:
+                classes[None] = []
+
+            result = GroupBuilder(self.type, columnar=isinstance(gam, ColumnarGeomAttributesManager))
+
+            class_parts = [[parts[i] for i in indices] for indices in classes.values()]
+
+            if workers is None or workers <= 1:
+                unions = [sh.ops.unary_union(p) for p in class_parts]
+            else:
+                # every class shares one process pool
+                unions = parallel.tiled_unions(class_parts, workers)
 
-            for k, d in self.geom_attributes_manager.attributes:
-                combined_attributes.update(d)
+            for indices, union in zip(classes.values(), unions):
+                combined_attributes = dict()
+                for i in indices:
+                    combined_attributes.update(gam.get_geom_attributes(i))
 
-            gam = MutableGeomAttributesManager()
-            for i, g in enumerate(union):
-                gam.add_attributes(i, combined_attributes)
+                result.add_geoms(flatten_geoms([union]), combined_attributes)
 
-            return Group(self.type(union), gam.to_immutable())
+            return result.build()
 
         elif isinstance(geom, Group):
-            return self.add(geom).union()
+            return self.add(geom).union(attribute_key=attribute_key, workers=workers)
         elif geom.type == "MultiPolygon" or geom.type == "MultiLineString":
             subgeoms = [g for g in geom.geoms]
 
@@ -190,102 +639,245 @@ class Group:
                 sh.geometry.MultiPolygon([g.union(geom) for g in self.geoms.geoms])
             )
 
+    @profiled
     def to(self, x_coord, y_coord, center=None):
 
         # if the user does not define a center, use the
         # geometric centroid
-        cx = center[0] if center is not None else self.geoms.centroid.x
-        cy = center[1] if center is not None else self.geoms.centroid.y
+        if center is None and self._is_empty():
+            return Group(self._geoms)
+
+        cx, cy = center if center is not None else self.centroid
 
         dx = x_coord - cx
         dy = y_coord - cy
 
-        return Group(sh.affinity.translate(self.geoms, dx, dy))
+        return self._with_transform(translation_affine(dx, dy), GeomAttributesManager())
 
+    @profiled
     def buffer(self, amount, resolution=16, join_style=sh.geometry.JOIN_STYLE.round, cap_style=sh.geometry.CAP_STYLE.round):
         return Group.from_geomarray([self.geoms.buffer(amount, resolution, join_style=join_style, cap_style=cap_style)])
 
+    @profiled
     def translate(self, dx, dy):
-        return Group(sh.affinity.translate(self.geoms, dx, dy), self.geom_attributes_manager)
+        return self._with_transform(translation_affine(dx, dy), self.geom_attributes_manager)
 
+    @profiled
     def scale(self, x, y=None, origin='center'):
         y = y or x
 
-        return Group(sh.affinity.scale(self.geoms, xfact=x, yfact=y, origin=origin), self.geom_attributes_manager)
+        if self._is_empty():
+            return self
+
+        return self._with_transform(scale_affine(x, y, *self._resolve_origin(origin)), self.geom_attributes_manager)
 
+    @profiled
     def rotate(self, angle, use_radians=True, origin=None):
         if origin is None:
             origin = 'centroid'
 
+        if self._is_empty():
+            return self
+
+        if not use_radians:
+            angle = math.radians(angle)
+
         # rotations will preserve indices of sub-geometries
-        return Group(
-            sh.affinity.rotate(self.geoms, angle, use_radians=use_radians, origin=origin),
-            self.geom_attributes_manager)
+        return self._with_transform(rotation_affine(angle, *self._resolve_origin(origin)), self.geom_attributes_manager)
+
+    # if instanced is set the copies are stored as an instanced group, see instance
+    @profiled
+    def spin(self, center_x, center_y, count, geom_centroid=None, should_rotate=False, instanced=False):
+        result = GroupBuilder(self.type)
 
-    def spin(self, center_x, center_y, count, geom_centroid=None, should_rotate=False):
-        if geom_centroid is None:
-            geom_centroid = self.geoms.centroid
+        if self._is_empty():
+            return result.build()
 
-        result = Group(self.type([]))
-        angles = (a for a in np.linspace(0, 2 * math.pi, count, endpoint=False))
-        for theta in angles:
-            instance = self
+        gc_x, gc_y = self._resolve_origin(geom_centroid if geom_centroid is not None else 'centroid')
+
+        # one matrix per copy
+        matrices = []
+        for theta in np.linspace(0, 2 * math.pi, count, endpoint=False):
+            matrix = rotation_affine(theta, center_x, center_y)
             if not should_rotate:
-                instance = instance.rotate(-theta, use_radians=True, origin=geom_centroid)
+                matrix = compose_affine(rotation_affine(-theta, gc_x, gc_y), matrix)
 
-            instance = instance.rotate(theta, use_radians=True, origin=sh.geometry.Point(center_x, center_y))
+            matrices.append(matrix)
 
-            result = result.add(instance)
+        if instanced:
+            return self.instance(matrices)
 
-        return result
+        # applied together with any pending transform
+        if self._transform is not None:
+            matrices = [compose_affine(self._transform, m) for m in matrices]
+
+        for instance in affine_copies(list(self._geoms.geoms), matrices):
+            result.add_geoms_with_attributes(instance, self.geom_attributes_manager)
+
+        return result.build()
+
+    # Returns a copy of this group transformed by each of the affine matrices (see utils)
+    # in turn. Only this group's geoms and the matrices are stored until something needs
+    # the geoms of the copies, and RenderBuilder draws the copies as svg <use> elements.
+    @profiled
+    def instance(self, matrices):
+        matrices = np.array(list(matrices), dtype=float).reshape(-1, 6)
+
+        if self._is_empty() or len(matrices) == 0:
+            return GroupBuilder(self.type).build()
+
+        if self._instances is not None:
+            template = self._instances[0]
+            inner = self._instance_matrices()
+        else:
+            template = list(self._geoms.geoms)
+            inner = np.array([self._transform or IDENTITY_AFFINE], dtype=float)
+
+        # for each of matrices, each of the inner matrices followed by it
+        combined = np.stack(
+            compose_affine(inner.T[:, np.newaxis, :], matrices.T[:, :, np.newaxis]), axis=-1).reshape(-1, 6)
+
+        gam = _repeat_attributes(self.geom_attributes_manager, len(template) * len(inner), len(matrices))
+
+        return Group._instanced(template, combined, self.type, gam)
+
+    # as instance, with copies translated so that center (by default the centroid) is
+    # at each of the coordinates
+    @profiled
+    def instance_at(self, coordinates, center=None):
+        if self._is_empty():
+            return self
+
+        cx, cy = center if center is not None else self.centroid
+        coordinates = np.array(list(coordinates), dtype=float).reshape(-1, 2)
+
+        matrices = np.zeros((len(coordinates), 6))
+        matrices[:, 0] = 1
+        matrices[:, 3] = 1
+        matrices[:, 4] = coordinates[:, 0] - cx
+        matrices[:, 5] = coordinates[:, 1] - cy
+
+        return self.instance(matrices)
 
+    # (template geoms, array of affine matrices) if this is an instanced group which has
+    # not yet been expanded, otherwise None. The geoms of the group are each of the
+    # template geoms transformed by the first matrix, then the second, and so on.
+    def instances(self):
+        if self._instances is None:
+            return None
+
+        return self._instances[0], self._instance_matrices()
+
+    @profiled
     def linarray(self, count, geom_modifier):
-        result = Group()
+        result = GroupBuilder()
         for i in range(0, count):
-            new_geom = geom_modifier(i, self)
-            result = result.add(new_geom)
+            result.add(geom_modifier(i, self))
 
-        return result
+        return result.build()
 
-    def recurse(self, modifier, depth):
+    # subgroups are added one level of depth at a time, see iter_recurse
+    @profiled
+    def recurse(self, modifier, depth, prune=None, workers=None):
         if depth == 0:
             return self
 
-        result = []
-        self._recurse(modifier, depth, result)
+        return self.add_all(self.iter_recurse(modifier, depth, prune, workers))
+
+    # yields the subgroups produced by repeatedly applying modifier, a level of depth
+    # at a time, so only the current level is held in memory. subgroups for which
+    # prune returns true are dropped along with everything they would have produced.
+    # if workers is set, each level's modifier calls are made in that many worker
+    # processes, and modifier must be a module level function
+    def iter_recurse(self, modifier, depth, prune=None, workers=None):
+        if workers is not None and workers > 1:
+            with parallel.group_executor(workers) as executor:
+                yield from self._iter_levels(
+                    depth, prune, lambda level: parallel.map_groups(executor, modifier, level, workers))
+        else:
+            yield from self._iter_levels(depth, prune, lambda level: map(modifier, level))
+
+    def _iter_levels(self, depth, prune, map_level):
+        level = [self]
 
-        return self.add_all(result)
+        for remaining in range(depth, 0, -1):
+            next_level = []
 
-    def _recurse(self, modifier, depth, result):
-        if depth == 0:
-            return
+            for subgroups in map_level(level):
+                for g in subgroups:
+                    if prune is not None and prune(g):
+                        continue
 
-        subgroups = modifier(self)
+                    yield g
 
-        result += subgroups
+                    if remaining > 1:
+                        next_level.append(g)
 
-        for g in subgroups:
-            g._recurse(modifier, depth - 1, result)
+            level = next_level
 
     # todo: deprecated, use explode instead
-    def foreach_modify(self, modifier):
-        return Group.from_geomarray([modifier(g) for g in self.geoms.geoms], self.geom_attributes_manager)
+    # if workers is set, modifier must be a module level function so it can be sent to the workers
+    @profiled
+    def foreach_modify(self, modifier, workers=None):
+        return Group.from_geomarray(
+            [r[0] for r in self._map_parts(_modify_parts, modifier, workers)], self.geom_attributes_manager)
+
+    # tolerance, if set, is the maximum distance of the polygon from the true circle,
+    # otherwise there's at least 1 segment per resolution (0.5mm by default) of circumference
+    @staticmethod
+    def circle(cx, cy, diameter, resolution=0.5, tolerance=None):
+        return Group.circles([(cx, cy)], diameter, resolution, tolerance)
 
+    # a circle centered on each of centers, built from a single shared template
     @staticmethod
-    def circle(cx, cy, diameter, resolution=0.5):
-        # resolution by default at least 1 step per 0.5mm
-        divisions = max(1, int(math.pi * diameter * 0.25 / resolution))
+    @profiled
+    def circles(centers, diameter, resolution=0.5, tolerance=None):
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
 
-        circle = sh.geometry.Point(cx, cy).buffer(diameter / 2, resolution=divisions)
+        if diameter <= 0 or len(centers) == 0:
+            return Group()
 
-        return Group(sh.geometry.MultiPolygon([
-                circle
-            ]))
+        if tolerance is None:
+            segment_count = 4 * max(1, int(math.pi * diameter * 0.25 / resolution))
+        else:
+            segment_count = circle_segment_count(diameter / 2, tolerance)
+
+        rings = unit_circle_ring(segment_count) * (diameter / 2) + centers[:, np.newaxis, :]
+
+        return Group(sh.geometry.MultiPolygon([sh.geometry.Polygon(r) for r in rings]))
+
+    # regular polygon with its vertices radius from the center, the first at angle
+    # (in radians) from the x axis
+    @staticmethod
+    def regular_polygon(cx, cy, radius, sides, angle=0):
+        if sides < 3:
+            raise ValueError(f"Regular polygon needs at least 3 sides: {sides}")
+
+        c, s = math.cos(angle), math.sin(angle)
+        ring = unit_circle_ring(sides) @ np.array([[c, s], [-s, c]]) * radius + (cx, cy)
+
+        return Group(sh.geometry.MultiPolygon([sh.geometry.Polygon(ring)]))
+
+    # geoms of this group whose envelope contains the envelope of all of the supplied groups geoms
+    def _enveloping_geoms(self, group):
+        b = group.bounds
+        envelope = sh.geometry.box(*b)
+
+        parts = self._get_spatial_index()[1]
+
+        for i in self._query(envelope):
+            g = parts[i]
+            gb = g.bounds
+            if gb[0] <= b[0] and gb[1] <= b[1] and gb[2] >= b[2] and gb[3] >= b[3]:
+                yield g
 
     def covers(self, group):
         # returns true if any of this groups geoms cover ALL of
         # the supplied groups geoms
-        for g in self.geoms.geoms:
+        if group._is_empty():
+            return not self._is_empty()
+
+        for g in self._enveloping_geoms(group):
 
             if all(g.covers(h) for h in group.geoms.geoms):
                 return True
@@ -295,7 +887,10 @@ class Group:
     def contains(self, group):
         # returns true if any of this groups geoms contain ALL of
         # the supplied groups geoms
-        for g in self.geoms.geoms:
+        if group._is_empty():
+            return not self._is_empty()
+
+        for g in self._enveloping_geoms(group):
 
             if all(g.covers(h) and not g.crosses(h) for h in group.geoms.geoms):
                 return True
@@ -305,13 +900,16 @@ class Group:
     def intersects(self, group):
         # returns true if any of this groups geoms intersect ANY of
         # the supplied groups geoms
-        for g in self.geoms.geoms:
+        parts = self._get_spatial_index()[1]
 
-            if any(g.intersects(h) for h in group.geoms.geoms):
+        for h in group.geoms.geoms:
+
+            if any(parts[i].intersects(h) for i in self._query(h)):
                 return True
 
         return False
 
+    @profiled
     def to_boundary(self):
         if self.type != sh.geometry.MultiPolygon:
             raise ValueError("Group is already of boundary type.")
@@ -353,45 +951,242 @@ class Group:
 
         group_type = groups[0].type
 
-        result = Group(group_type())
+        result = GroupBuilder(group_type)
         for g in groups:
-            result = result.add(g.anchor().translate(x_current, 0))
+            result.add(g.anchor().translate(x_current, 0))
             x_current += g.bounds_width + clearance
 
-        return result
+        return result.build()
+
+    # compact binary form of this group and its attributes, see serialization
+    def to_bytes(self):
+        return serialization.dumps(self.geoms, self.geom_attributes_manager, self._precision)
 
     @staticmethod
-    def from_text(text, font_face, font_size, font_slant=cairo.FontSlant.NORMAL, font_weight=cairo.FontWeight.NORMAL):
-        # Annoyingly a value of int('inf'), 0, -1, or some other constant won't work here as for small dimensions
-        # text seems to get cut off at arbitrary limits, so I just went with a "very big number".
-        surface = cairo.SVGSurface(None, 2147483647, 2147483647)
-        context = cairo.Context(surface)
+    def from_bytes(data):
+        return Group._deserialized(*serialization.loads(data))
 
-        context.select_font_face(font_face, font_slant, font_weight)
-        context.set_font_size(font_size)
+    def to_file(self, file_path):
+        serialization.dump(self.geoms, self.geom_attributes_manager, file_path, self._precision)
 
-        context.move_to(0, 0)
-        context.text_path(text)
+    @staticmethod
+    def from_file(file_path):
+        return Group._deserialized(*serialization.load(file_path))
 
-        path = context.copy_path_flat()
+    @staticmethod
+    def _deserialized(geoms, geom_attributes_manager, precision):
+        result = Group(geoms, geom_attributes_manager)
+        result._precision = precision
 
-        polygons = []
-        coord_stack = []
+        return result
 
-        for p in path:
-            type = p[0]
-            coords = p[1]
+    # characters are laid out using glyph outlines cached by _glyph_outline. font_slant and
+    # font_weight are cairo.FontSlant and cairo.FontWeight values, NORMAL by default
+    @staticmethod
+    @profiled
+    def from_text(text, font_face, font_size, font_slant=None, font_weight=None):
+        polygons = []
+        x, y = 0, 0
 
-            if type == cairo.PathDataType.MOVE_TO:
-                coord_stack.append(coords)
-            elif type == cairo.PathDataType.LINE_TO:
-                coord_stack.append(coords)
-            elif type == cairo.PathDataType.CLOSE_PATH:
-                next_polygon = sh.geometry.Polygon(coord_stack + [ coord_stack[0] ])
+        for char in text:
+            rings, (dx, dy) = _glyph_outline(char, font_face, font_size, font_slant, font_weight)
 
-                polygons.append(next_polygon)
-                coord_stack.clear()
+            polygons += [sh.geometry.Polygon(r + (x, y)) for r in rings]
 
-        surface.finish()
+            x += dx
+            y += dy
 
         return Group.from_geomarray(polygons)
+
+    # a group for each of texts, as from_text
+    @staticmethod
+    def from_text_lines(texts, font_face, font_size, font_slant=None, font_weight=None):
+        return [Group.from_text(t, font_face, font_size, font_slant, font_weight) for t in texts]
+
+
+# Flattened outline of a single character drawn at the origin, as a list of closed
+# rings, along with the position the next character starts at.
+@functools.lru_cache(maxsize=4096)
+def _glyph_outline(char, font_face, font_size, font_slant, font_weight):
+    # imported here as it's slow to load and only needed for text
+    import cairo
+
+    # Annoyingly a value of int('inf'), 0, -1, or some other constant won't work here as for small dimensions
+    # text seems to get cut off at arbitrary limits, so I just went with a "very big number".
+    surface = cairo.SVGSurface(None, 2147483647, 2147483647)
+    context = cairo.Context(surface)
+
+    context.select_font_face(
+        font_face,
+        cairo.FontSlant.NORMAL if font_slant is None else font_slant,
+        cairo.FontWeight.NORMAL if font_weight is None else font_weight)
+    context.set_font_size(font_size)
+
+    context.move_to(0, 0)
+    context.text_path(char)
+
+    advance = context.get_current_point()
+    path = context.copy_path_flat()
+
+    rings = []
+    coord_stack = []
+
+    for p in path:
+        type = p[0]
+        coords = p[1]
+
+        if type == cairo.PathDataType.MOVE_TO:
+            coord_stack.append(coords)
+        elif type == cairo.PathDataType.LINE_TO:
+            coord_stack.append(coords)
+        elif type == cairo.PathDataType.CLOSE_PATH:
+            ring = np.array(coord_stack + [coord_stack[0]], dtype=float)
+
+            # shared between all callers
+            ring.setflags(write=False)
+
+            rings.append(ring)
+            coord_stack.clear()
+
+    surface.finish()
+
+    return tuple(rings), advance
+
+
+# per-part operations used by Group, module level so that they can be run by parallel.map_geoms
+
+# value, with lists and arrays as tuples, dicts as sorted item tuples and sets as
+# frozensets so it can be used as a dict key, see union
+def _hashable(value, attribute_key):
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_hashable(v, attribute_key) for v in value)
+    elif isinstance(value, dict):
+        return tuple(sorted(((k, _hashable(v, attribute_key)) for k, v in value.items()), key=lambda i: repr(i[0])))
+    elif isinstance(value, (set, frozenset)):
+        return frozenset(_hashable(v, attribute_key) for v in value)
+
+    try:
+        hash(value)
+    except TypeError:
+        raise ValueError(f"Can't union by attribute {attribute_key!r}, value isn't hashable: {value!r}")
+
+    return value
+
+
+def _intersection_parts(parts, group):
+    result = []
+    for g in parts:
+        candidates = group._query_geoms(g)
+        result.append([] if candidates is None else [g.intersection(candidates)])
+
+    return result
+
+
+def _difference_parts(parts, group):
+    result = []
+    for g in parts:
+        candidates = group._query_geoms(g)
+        result.append(flatten_geoms([g if candidates is None else g.difference(candidates)]))
+
+    return result
+
+
+def _modify_parts(parts, modifier):
+    return [[modifier(g)] for g in parts]
+
+
+def _expand_instances(template, matrices):
+    return [g for instance in affine_copies(template, matrices) for g in instance]
+
+
+# attributes of a group repeated for copy_count copies of its part_count parts
+def _repeat_attributes(geom_attributes_manager, part_count, copy_count):
+    if isinstance(geom_attributes_manager, ColumnarGeomAttributesManager):
+        return ColumnarGeomAttributesManager.concatenate(
+            [geom_attributes_manager.offset_keys(i * part_count) for i in range(copy_count)])
+
+    result = MutableGeomAttributesManager()
+    for i in range(copy_count):
+        for k, v in geom_attributes_manager.shared_attributes:
+            result.add_shared_attributes(k + i * part_count, v)
+
+    return result.to_immutable()
+
+
+# Mutable counterpart to Group, exists for performance reasons. Group.add
+# copies every geom and attribute on each call, so accumulating n parts
+# through repeated adds is quadratic. Append parts here and build() once.
+class GroupBuilder:
+
+    # if columnar is set (or any added group uses columnar attributes) the
+    # built group uses a ColumnarGeomAttributesManager
+    def __init__(self, geom_type=None, columnar=False):
+        self._geom_type = geom_type
+        self._fallback_geom_type = None
+        self._geoms = []
+        self._geom_attributes_manager = MutableGeomAttributesManager()
+        self._columnar = columnar
+        self._columnar_parts = []
+
+    def __len__(self):
+        return len(self._geoms)
+
+    def _update_geom_type(self, geom_type, is_empty):
+        if self._geom_type is not None:
+            return
+
+        if not is_empty:
+            self._geom_type = geom_type
+        elif self._fallback_geom_type is None:
+            self._fallback_geom_type = geom_type
+
+    def add(self, group):
+        if not isinstance(group, Group):
+            raise ValueError("Added group is of wrong type.")
+
+        subgeoms = group._parts()
+
+        self._update_geom_type(group.type, len(subgeoms) == 0)
+
+        return self.add_geoms_with_attributes(subgeoms, group.geom_attributes_manager)
+
+    # appends raw (non-multi) shapely geoms along with a manager holding
+    # their attributes, indexed from 0
+    def add_geoms_with_attributes(self, geoms, geom_attributes_manager):
+        key_index_offset = len(self._geoms)
+        self._geoms += geoms
+
+        if isinstance(geom_attributes_manager, ColumnarGeomAttributesManager):
+            self._columnar = True
+            self._columnar_parts.append(geom_attributes_manager.offset_keys(key_index_offset))
+        else:
+            for k, v in geom_attributes_manager.shared_attributes:
+                self._geom_attributes_manager.add_shared_attributes(k + key_index_offset, v)
+
+        return self
+
+    def add_all(self, groups):
+        for g in groups:
+            self.add(g)
+
+        return self
+
+    # appends raw (non-multi) shapely geoms, each receiving a copy of
+    # the supplied attributes
+    def add_geoms(self, geoms, attributes=None):
+        for geom in geoms:
+            if attributes:
+                self._geom_attributes_manager.add_attributes(len(self._geoms), attributes)
+
+            self._geoms.append(geom)
+
+        return self
+
+    def build(self):
+        geom_type = self._geom_type or self._fallback_geom_type or sh.geometry.MultiPolygon
+
+        gam = self._geom_attributes_manager.to_immutable()
+        if self._columnar:
+            gam = ColumnarGeomAttributesManager.concatenate(self._columnar_parts + [gam])
+
+        return Group(geom_type(self._geoms), gam)
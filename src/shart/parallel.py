@@ -0,0 +1,143 @@
+import concurrent.futures
+import math
+
+import numpy as np
+import shapely as sh
+import shapely.ops
+import shapely.wkb
+
+
+# Runs per-geom shapely work in a process pool. Geoms are shipped to and from
+# the workers as WKB, in chunks, and results are returned in input order.
+
+_argument = None
+
+
+def _set_argument(argument):
+    global _argument
+    _argument = argument
+
+
+def _run_chunk(function, wkbs):
+    geoms = [sh.wkb.loads(w) for w in wkbs]
+
+    return [[r.wkb for r in results] for results in function(geoms, _argument)]
+
+
+def _run_group(function, wkbs):
+    return [r.wkb for r in function([sh.wkb.loads(w) for w in wkbs], _argument)]
+
+
+def _executor(workers, argument):
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_set_argument, initargs=(argument,))
+
+
+# function(geoms, argument) must return a list holding a list of result geoms
+# for each input geom. It must be a module level function so it can be pickled,
+# argument is pickled once per worker.
+def map_geoms(function, geoms, workers, argument=None, chunk_size=None):
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(len(geoms) / (workers * 4)))
+
+    wkbs = [g.wkb for g in geoms]
+    chunks = [wkbs[i:i + chunk_size] for i in range(0, len(wkbs), chunk_size)]
+
+    result = []
+
+    with _executor(workers, argument) as executor:
+
+        for chunk_result in executor.map(_run_chunk, [function] * len(chunks), chunks):
+            result += [[sh.wkb.loads(w) for w in r] for r in chunk_result]
+
+    return result
+
+
+# as map_geoms, but function(geoms, argument) is called once for each list in
+# geom_groups and returns a single list of result geoms
+def map_geom_groups(function, geom_groups, workers, argument=None):
+    wkb_groups = [[g.wkb for g in geoms] for geoms in geom_groups]
+
+    with _executor(workers, argument) as executor:
+        return [
+            [sh.wkb.loads(w) for w in r]
+            for r in executor.map(_run_group, [function] * len(wkb_groups), wkb_groups)
+        ]
+
+
+# process pool for map_groups, which can be reused across calls
+def group_executor(workers):
+    return _executor(workers, None)
+
+
+# calls function(group) for each group in the executor's worker processes, results
+# are yielded in input order. function and groups are pickled
+def map_groups(executor, function, groups, workers):
+    chunk_size = max(1, math.ceil(len(groups) / (workers * 4)))
+
+    return executor.map(function, groups, chunksize=chunk_size)
+
+
+# splits geoms into lists of nearby geoms, using a grid of roughly tile_count
+# cells over the centres of the geoms envelopes
+def partition_by_tile(geoms, tile_count):
+    if len(geoms) == 0:
+        return []
+
+    bounds = np.array([g.bounds for g in geoms])
+    centers = (bounds[:, 0:2] + bounds[:, 2:4]) / 2
+
+    side = max(1, math.ceil(math.sqrt(tile_count)))
+
+    minimum = centers.min(axis=0)
+    extent = np.maximum(centers.max(axis=0) - minimum, 1e-12)
+
+    cells = np.minimum((side * (centers - minimum) / extent).astype(int), side - 1)
+    tile_indices = cells[:, 1] * side + cells[:, 0]
+
+    tiles = dict()
+    for geom, tile_index in zip(geoms, tile_indices):
+        tiles.setdefault(tile_index, []).append(geom)
+
+    return [tiles[k] for k in sorted(tiles)]
+
+
+def _union_geom_group(geoms, argument):
+    return [sh.ops.unary_union(geoms)]
+
+
+# unions each tile of geoms in the process pool, then unions the (much simpler)
+# tile results to stitch the seams between tiles
+def tiled_union(geoms, workers, tiles_per_worker=4):
+    return tiled_unions([geoms], workers, tiles_per_worker)[0]
+
+
+# fewer geoms than this are unioned in this process, as shipping them to workers costs more
+MIN_TILED_UNION_GEOMS = 64
+
+
+# the union of each list of geoms, as tiled_union, with the tiles of every list
+# sharing a single process pool
+def tiled_unions(geom_lists, workers, tiles_per_worker=4):
+    results = [None] * len(geom_lists)
+
+    # (index of the list, its tiles) for each list unioned in the pool
+    tiled = []
+
+    for i, geoms in enumerate(geom_lists):
+        tiles = partition_by_tile(geoms, workers * tiles_per_worker) if len(geoms) >= MIN_TILED_UNION_GEOMS else []
+
+        if len(tiles) > 1:
+            tiled.append((i, tiles))
+        else:
+            results[i] = sh.ops.unary_union(geoms)
+
+    if len(tiled) == 0:
+        return results
+
+    tile_unions = iter(map_geom_groups(_union_geom_group, [t for _, tiles in tiled for t in tiles], workers))
+
+    for i, tiles in tiled:
+        results[i] = sh.ops.unary_union([g for _ in tiles for g in next(tile_unions)])
+
+    return results
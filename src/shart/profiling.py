@@ -0,0 +1,244 @@
+import atexit
+import collections
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+
+# Opt-in profiling of Group operations and rendering.
+#
+#   with profiling.profile() as p:
+#       ...
+#   print(p.summary())
+#   p.write_trace("trace.json")
+#
+# records each call of a method decorated with profiled: its time, and the part and
+# vertex counts of the Groups passed in and returned. Groups passed in generators
+# aren't counted, as that would consume them.
+#
+# Setting SHART_PROFILE profiles the whole script, printing the summary to stderr on
+# exit, or writing a Chrome trace (chrome://tracing, or https://ui.perfetto.dev) if
+# it's the path of a .json file.
+#
+# Counting vertices takes time, which is left out of the call itself but not out of
+# calls enclosing it, pass counts=False to only record times.
+
+_profiles = []
+_stack = threading.local()
+
+# nested is set for calls made within a call of the same operation
+Event = collections.namedtuple("Event", ["name", "start", "seconds", "self_seconds", "nested", "thread", "counts"])
+
+
+class Profile:
+
+    def __init__(self, counts=True):
+        self.counts = counts
+        self.events = []
+        self._lock = threading.Lock()
+
+    def _record(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    # per operation totals, name -> dict. seconds includes nested calls of other
+    # operations, but not of the same operation, which would count twice
+    def stats(self):
+        result = dict()
+
+        for event in self.events:
+            stat = result.setdefault(event.name, {
+                "calls": 0, "seconds": 0.0, "self_seconds": 0.0,
+                "parts_in": 0, "parts_out": 0, "vertices_in": 0, "vertices_out": 0
+            })
+
+            stat["calls"] += 1
+            stat["self_seconds"] += event.self_seconds
+
+            if not event.nested:
+                stat["seconds"] += event.seconds
+
+            for key, value in event.counts.items():
+                stat[key] += value
+
+        return result
+
+    def summary(self, sort="seconds"):
+        stats = sorted(self.stats().items(), key=lambda s: s[1][sort], reverse=True)
+
+        lines = [f"{'operation':<32}{'calls':>8}{'total s':>10}{'self s':>10}"
+                 f"{'parts in':>10}{'parts out':>10}{'verts in':>12}{'verts out':>12}"]
+
+        for name, s in stats:
+            lines.append(f"{name:<32}{s['calls']:>8}{s['seconds']:>10.3f}{s['self_seconds']:>10.3f}"
+                         f"{s['parts_in']:>10}{s['parts_out']:>10}{s['vertices_in']:>12}{s['vertices_out']:>12}")
+
+        return "\n".join(lines)
+
+    # Chrome trace event format, one complete event per call
+    def trace(self):
+        start = min((e.start for e in self.events), default=0)
+        pid = os.getpid()
+
+        return {
+            "traceEvents": [{
+                "name": e.name,
+                "cat": "shart",
+                "ph": "X",
+                "ts": (e.start - start) * 1e6,
+                "dur": e.seconds * 1e6,
+                "pid": pid,
+                "tid": e.thread,
+                "args": e.counts
+            } for e in self.events],
+            "displayTimeUnit": "ms"
+        }
+
+    def write_trace(self, file_path):
+        with open(file_path, "w") as f:
+            json.dump(self.trace(), f)
+
+
+@contextlib.contextmanager
+def profile(counts=True):
+    result = Profile(counts)
+    _profiles.append(result)
+
+    try:
+        yield result
+    finally:
+        _profiles.remove(result)
+
+
+def is_profiling():
+    return len(_profiles) > 0
+
+
+# records calls of function while profiling, functions are called directly otherwise
+def profiled(function):
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _profiles:
+            return function(*args, **kwargs)
+
+        return _call_profiled(name, function, args, kwargs)
+
+    return wrapper
+
+
+def _call_profiled(name, function, args, kwargs):
+    profiles = list(_profiles)
+    counts = any(p.counts for p in profiles)
+
+    counts_in = _count_groups(list(args) + list(kwargs.values())) if counts else None
+
+    stack = _thread_stack()
+    nested = any(name == call[0] for call in stack)
+    stack.append([name, 0.0])
+
+    start = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        children_seconds = stack.pop()[1]
+
+        if stack:
+            stack[-1][1] += seconds
+
+    if counts:
+        counts_out = _count_groups([result])
+        event_counts = {
+            "parts_in": counts_in[0], "vertices_in": counts_in[1],
+            "parts_out": counts_out[0], "vertices_out": counts_out[1]
+        }
+    else:
+        event_counts = dict()
+
+    event = Event(name, start, seconds, seconds - children_seconds, nested, threading.get_ident(), event_counts)
+
+    for p in profiles:
+        p._record(event if p.counts else event._replace(counts=dict()))
+
+    return result
+
+
+# [operation name, seconds spent in nested calls] for each call in progress on this thread
+def _thread_stack():
+    if not hasattr(_stack, "calls"):
+        _stack.calls = []
+
+    return _stack.calls
+
+
+# (parts, vertices) of the Groups in values, or in lists and tuples in values. Counted
+# on the untransformed geometry so lazy transforms and instances aren't applied
+def _count_groups(values):
+    from .group import Group
+
+    parts = 0
+    vertices = 0
+
+    for value in values:
+        if isinstance(value, (list, tuple)):
+            value_parts, value_vertices = _count_groups(value)
+
+            parts += value_parts
+            vertices += value_vertices
+        elif isinstance(value, Group):
+            if value._instances is not None:
+                template, matrices = value._instances
+                template_counts = [_count_geoms(g) for g in template]
+                template_parts = sum(c[0] for c in template_counts)
+                template_vertices = sum(c[1] for c in template_counts)
+
+                parts += template_parts * len(matrices)
+                vertices += template_vertices * len(matrices)
+            else:
+                value_parts, value_vertices = _count_geoms(value._base())
+
+                parts += value_parts
+                vertices += value_vertices
+
+    return parts, vertices
+
+
+def _count_geoms(geom):
+    if geom.is_empty:
+        return 0, 0
+
+    if hasattr(geom, "geoms"):
+        counts = [_count_geoms(g) for g in geom.geoms]
+        return sum(c[0] for c in counts), sum(c[1] for c in counts)
+
+    if geom.geom_type == "Polygon":
+        return 1, len(geom.exterior.coords) + sum(len(r.coords) for r in geom.interiors)
+
+    return 1, len(geom.coords)
+
+
+def _profile_from_environment():
+    target = os.environ.get("SHART_PROFILE", "")
+
+    if target == "" or target == "0":
+        return
+
+    environment_profile = Profile()
+    _profiles.append(environment_profile)
+
+    def report():
+        if target.endswith(".json"):
+            environment_profile.write_trace(target)
+        else:
+            print(environment_profile.summary(), file=sys.stderr)
+
+    atexit.register(report)
+
+
+_profile_from_environment()
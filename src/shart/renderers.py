@@ -1,13 +1,21 @@
-import cairo
+import os
 
-from defusedxml import ElementTree as etree
+import numpy as np
 import shapely as sh
 import shapely.validation
 import shapely.geometry
 
+from xml.sax.saxutils import quoteattr
+
+from .profiling import profiled
+from .utils import compose_affine, translation_affine
+
 
 class PrimitiveRenderer:
 
+    # whether the definition methods below are implemented
+    SUPPORTS_DEFINITIONS = False
+
     def init_canvas(self):
         raise NotImplementedError()
 
@@ -17,6 +25,12 @@ class PrimitiveRenderer:
     def path_point(self, x0, y0):
         raise NotImplementedError()
 
+    # draws lines to each of the points in an (n, 2) array in turn, backends should
+    # override this with something faster than a path_point call per point
+    def path_points(self, coords):
+        for x, y in coords.tolist():
+            self.path_point(x, y)
+
     def path_move_to(self, x0, y0):
         raise NotImplementedError()
 
@@ -29,14 +43,79 @@ class PrimitiveRenderer:
     def finish_canvas(self):
         raise NotImplementedError()
 
+    # called instead of finish_canvas when rendering fails, to release any resources
+    # and remove partial output
+    def abort_canvas(self):
+        pass
+
+    # paths drawn between start_definition and end_definition are not drawn
+    # directly, instead they're drawn by each use_definition call
+    def start_definition(self, definition_id):
+        raise NotImplementedError()
+
+    def end_definition(self):
+        raise NotImplementedError()
+
+    def use_definition(self, definition_id, matrix):
+        raise NotImplementedError()
+
+
+# numbers and styles written the same way cairo writes them
+
+def svg_number(value):
+    result = f"{value:f}".rstrip("0").rstrip(".")
+
+    return "0" if result == "-0" else result
+
+
+# svg_number of each value in an array, formatted together as that's much faster
+def svg_numbers(values):
+    formatted = ("%f " * values.size % tuple(values.ravel().tolist())).split()
+
+    return ["0" if n == "-0" else n for n in (f.rstrip("0").rstrip(".") for f in formatted)]
+
+
+# path data drawing lines to each point of an (n, 2) array
+def svg_line_data(coords):
+    numbers = svg_numbers(coords)
+
+    return " ".join(map("L {} {}".format, numbers[0::2], numbers[1::2]))
+
+
+def svg_path_style(color=None, fill=False):
+    if color is None:
+        color = (0, 0, 0)
+
+    rgb = ",".join(svg_number(c * 100) + "%" for c in color[:3])
+    opacity = svg_number(color[3] if len(color) > 3 else 1)
+
+    if fill:
+        return f" stroke:none;fill-rule:evenodd;fill:rgb({rgb});fill-opacity:{opacity};"
+    else:
+        return f"fill:none;stroke-width:1;stroke-linecap:butt;stroke-linejoin:miter;stroke:rgb({rgb});" \
+               f"stroke-opacity:{opacity};stroke-miterlimit:10;"
+
+
+# svg transform attribute for an affine matrix in shapely's order (see utils)
+def svg_matrix(matrix):
+    a, b, d, e, xoff, yoff = matrix
+
+    return "matrix(" + ",".join(svg_number(v) for v in (a, d, b, e, xoff, yoff)) + ")"
+
 
 class SVGPrimitiveRenderer(PrimitiveRenderer):
 
+    SUPPORTS_DEFINITIONS = True
+
     class SVGFileModifier:
 
         def __init__(self):
             self.lines = []
 
+            # (definition id, [(path data, style)]) and (definition id, matrix)
+            self.definitions = []
+            self.uses = []
+
         def read(self):
             raise NotImplementedError()
 
@@ -44,6 +123,8 @@ class SVGPrimitiveRenderer(PrimitiveRenderer):
             self.lines.append(content)
 
         def get_modified_contents(self):
+            from defusedxml import ElementTree as etree
+
             document = ''.join(line.decode("utf-8") for line in self.lines)
             tree = etree.fromstring(document)
 
@@ -55,14 +136,39 @@ class SVGPrimitiveRenderer(PrimitiveRenderer):
             group_element = groups[0]
             group_element.attrib["id"] = "surface"
 
+            self._add_definitions(tree, group_element)
+
             return etree.tostring(tree, encoding="unicode")
 
+        # definitions are added as <defs>, and their uses drawn after everything else
+        def _add_definitions(self, tree, group_element):
+            if len(self.definitions) == 0:
+                return
+
+            namespace = tree.tag[:tree.tag.index("}") + 1] if tree.tag.startswith("{") else ""
+
+            defs = tree.makeelement(namespace + "defs", {})
+            tree.insert(list(tree).index(group_element), defs)
+
+            for definition_id, paths in self.definitions:
+                definition = tree.makeelement(namespace + "g", {"id": definition_id})
+                defs.append(definition)
+
+                for path_data, style in paths:
+                    definition.append(tree.makeelement(namespace + "path", {"style": style, "d": path_data}))
+
+            for definition_id, matrix in self.uses:
+                group_element.append(tree.makeelement(namespace + "use", {
+                    "{http://www.w3.org/1999/xlink}href": "#" + definition_id,
+                    "transform": svg_matrix(matrix)
+                }))
+
     def __init__(self,
                  output_file_path,
                  width,
                  height,
                  fill_background=False,
-                 svg_unit=cairo.SVGUnit.MM):
+                 svg_unit=None):
         self._output_file_path = output_file_path
         self._svg_file_modifier = SVGPrimitiveRenderer.SVGFileModifier()
         self._width = width
@@ -73,12 +179,18 @@ class SVGPrimitiveRenderer(PrimitiveRenderer):
         self.surface = None
         self.context = None
 
+        # paths of the definition being drawn, and the current path's data, see start_definition
+        self._definition_paths = None
+        self._definition_path = []
+
     def init_canvas(self):
         if self.surface is not None:
             raise RuntimeError("Surface already initialized.")
 
+        import cairo
+
         self.surface = cairo.SVGSurface(self._svg_file_modifier, self._width, self._height)
-        self.surface.set_document_unit(self._svg_unit)
+        self.surface.set_document_unit(cairo.SVGUnit.MM if self._svg_unit is None else self._svg_unit)
 
         self.context = cairo.Context(self.surface)
 
@@ -92,16 +204,43 @@ class SVGPrimitiveRenderer(PrimitiveRenderer):
         self.context.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
 
     def start_path(self, x0, y0):
+        if self._definition_paths is not None:
+            self._definition_path = [f"M {svg_number(x0)} {svg_number(y0)}"]
+            return
+
         self.context.new_path()
         self.context.move_to(x0, y0)
 
     def path_point(self, x0, y0):
+        if self._definition_paths is not None:
+            self._definition_path.append(f"L {svg_number(x0)} {svg_number(y0)}")
+            return
+
         self.context.line_to(x0, y0)
 
+    def path_points(self, coords):
+        if self._definition_paths is not None:
+            if len(coords) > 0:
+                self._definition_path.append(svg_line_data(coords))
+            return
+
+        line_to = self.context.line_to
+        for x, y in coords.tolist():
+            line_to(x, y)
+
     def path_move_to(self, x0, y0):
+        if self._definition_paths is not None:
+            self._definition_path.append(f"M {svg_number(x0)} {svg_number(y0)}")
+            return
+
         self.context.move_to(x0, y0)
 
     def draw_path(self, color=None, fill=False):
+        if self._definition_paths is not None:
+            self._definition_paths.append((" ".join(self._definition_path), svg_path_style(color, fill)))
+            self._definition_path = []
+            return
+
         if color is None:
             self.context.set_source_rgb(0, 0, 0)
         else:
@@ -113,8 +252,24 @@ class SVGPrimitiveRenderer(PrimitiveRenderer):
             self.context.stroke()
 
     def close_path(self):
+        if self._definition_paths is not None:
+            # as with cairo, closing a path which has already been drawn does nothing
+            if len(self._definition_path) > 0:
+                self._definition_path.append("Z")
+            return
+
         self.context.close_path()
 
+    def start_definition(self, definition_id):
+        self._definition_paths = []
+        self._svg_file_modifier.definitions.append((definition_id, self._definition_paths))
+
+    def end_definition(self):
+        self._definition_paths = None
+
+    def use_definition(self, definition_id, matrix):
+        self._svg_file_modifier.uses.append((definition_id, matrix))
+
     def finish_canvas(self):
         if self.surface is None:
             raise RuntimeError("Surface already completed.")
@@ -124,22 +279,137 @@ class SVGPrimitiveRenderer(PrimitiveRenderer):
         with open(self._output_file_path, "w") as f:
             f.write(self._svg_file_modifier.get_modified_contents())
 
+    def abort_canvas(self):
+        # nothing has been written to the output file yet
+        if self.surface is not None:
+            self.surface.finish()
+            self.surface = None
+
+
+# Writes SVG directly, each path being written to the output file as it's drawn, so
+# memory use doesn't grow with the document. Documents have the same structure and
+# styles as those written by SVGPrimitiveRenderer, without needing cairo.
+class StreamingSVGPrimitiveRenderer(PrimitiveRenderer):
+
+    SUPPORTS_DEFINITIONS = True
+
+    # suffix of the document's width and height for each unit, see RenderBuilder.units
+    UNIT_SUFFIXES = {
+        "user": "",
+        "em": "em",
+        "ex": "ex",
+        "px": "px",
+        "in": "in",
+        "inches": "in",
+        "cm": "cm",
+        "mm": "mm",
+        "pt": "pt",
+        "pc": "pc",
+        "percent": "%",
+    }
+
+    def __init__(self, output_file_path, width, height, fill_background=False, units="mm"):
+        if units not in StreamingSVGPrimitiveRenderer.UNIT_SUFFIXES:
+            raise ValueError(f"Unknown unit for svg: {units}")
+
+        self._output_file_path = output_file_path
+        self._width = width
+        self._height = height
+        self._fill_background = fill_background
+        self._units = units
+
+        self._file = None
+
+        # data of the path being drawn
+        self._path = []
+
+    def init_canvas(self):
+        if self._file is not None:
+            raise RuntimeError("Surface already initialized.")
+
+        suffix = StreamingSVGPrimitiveRenderer.UNIT_SUFFIXES[self._units]
+        width = svg_number(self._width)
+        height = svg_number(self._height)
+
+        self._file = open(self._output_file_path, "w")
+        self._file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            f'width="{width}{suffix}" height="{height}{suffix}" viewBox="0 0 {width} {height}" version="1.1">\n'
+            '<g id="surface">\n')
+
+        if self._fill_background:
+            self._file.write(f'<rect x="0" y="0" width="{width}" height="{height}" '
+                             f'style="fill:rgb(100%,100%,100%);fill-opacity:1;stroke:none;"/>\n')
+
+    def start_path(self, x0, y0):
+        self._path = [f"M {svg_number(x0)} {svg_number(y0)}"]
+
+    def path_point(self, x0, y0):
+        self._path.append(f"L {svg_number(x0)} {svg_number(y0)}")
+
+    def path_points(self, coords):
+        if len(coords) > 0:
+            self._path.append(svg_line_data(coords))
+
+    def path_move_to(self, x0, y0):
+        self._path.append(f"M {svg_number(x0)} {svg_number(y0)}")
+
+    def draw_path(self, color=None, fill=False):
+        self._file.write(f'<path style="{svg_path_style(color, fill)}" d="{" ".join(self._path)}"/>\n')
+        self._path = []
+
+    def close_path(self):
+        # as with cairo, closing a path which has already been drawn does nothing
+        if len(self._path) > 0:
+            self._path.append("Z")
+
+    def start_definition(self, definition_id):
+        self._file.write(f'<defs>\n<g id={quoteattr(definition_id)}>\n')
+
+    def end_definition(self):
+        self._file.write('</g>\n</defs>\n')
+
+    def use_definition(self, definition_id, matrix):
+        self._file.write(f'<use xlink:href={quoteattr("#" + definition_id)} transform="{svg_matrix(matrix)}"/>\n')
+
+    def finish_canvas(self):
+        if self._file is None:
+            raise RuntimeError("Surface already completed.")
+
+        self._file.write('</g>\n</svg>\n')
+        self._file.close()
+        self._file = None
+
+    def abort_canvas(self):
+        if self._file is None:
+            return
+
+        self._file.close()
+        self._file = None
+
+        os.remove(self._output_file_path)
+
 
 class GeometryRenderer:
 
+    # geom attributes used for rendering, and their values when not set
+    RENDER_ATTRIBUTE_DEFAULTS = {
+        "color": (0, 0, 0),
+        "fill": False
+    }
+
     def __init__(self, x_offset, y_offset):
         self._x_offset = x_offset
         self._y_offset = y_offset
 
-    def _offset_coords(self, x, y):
-        return self._x_offset + x, self._y_offset + y
+    # a ring or linestring's coordinates as an (n, 2) array, offset
+    def _offset_coords(self, geom):
+        return np.asarray(geom.coords)[:, :2] + (self._x_offset, self._y_offset)
 
     @staticmethod
     def _geom_attrs_to_named_args(geom_attributes):
-        return {
-            "color": geom_attributes.get("color", (0, 0, 0)),
-            "fill": geom_attributes.get("fill", False)
-        }
+        return {k: geom_attributes.get(k, v) for k, v in GeometryRenderer.RENDER_ATTRIBUTE_DEFAULTS.items()}
 
     def render(self, geometry, primitive_renderer, geom_attributes):
         if geometry.type == "LineString" or geometry.type == "LinearRing":
@@ -159,10 +429,10 @@ class GeometryRenderer:
             raise ValueError(f"Unsupported geometry type: {geometry.type}")
 
     def _render_polygon(self, linear_ring_exterior, linear_ring_interiors, primitive_renderer, geom_attributes):
-        primitive_renderer.start_path(*self._offset_coords(*linear_ring_exterior.coords[0]))
+        exterior = self._offset_coords(linear_ring_exterior)
 
-        for c in linear_ring_exterior.coords[1:]:
-            primitive_renderer.path_point(*self._offset_coords(*c))
+        primitive_renderer.start_path(*exterior[0].tolist())
+        primitive_renderer.path_points(exterior[1:])
 
         for interior_ring in linear_ring_interiors:
             if interior_ring.is_ccw == linear_ring_exterior.is_ccw:
@@ -170,22 +440,39 @@ class GeometryRenderer:
                                  f"interior ring ccw({interior_ring.is_ccw}). Coordinate orientation must differ "
                                  f"for rendering to work correctly.")
 
-            primitive_renderer.path_move_to(*self._offset_coords(*interior_ring.coords[0]))
-            for c in interior_ring.coords[1:]:
-                primitive_renderer.path_point(*self._offset_coords(*c))
+            interior = self._offset_coords(interior_ring)
+
+            primitive_renderer.path_move_to(*interior[0].tolist())
+            primitive_renderer.path_points(interior[1:])
 
         primitive_renderer.close_path()
         primitive_renderer.draw_path(**self._geom_attrs_to_named_args(geom_attributes))
 
     def _render_linestring(self, linestring, primitive_renderer, geom_attributes):
-        primitive_renderer.start_path(*self._offset_coords(*linestring.coords[0]))
+        coords = self._offset_coords(linestring)
 
-        for c in linestring.coords[1:]:
-            primitive_renderer.path_point(c[0] + self._x_offset, c[1] + self._y_offset)
+        primitive_renderer.start_path(*coords[0].tolist())
+        primitive_renderer.path_points(coords[1:])
 
         primitive_renderer.draw_path(**self._geom_attrs_to_named_args(geom_attributes))
         primitive_renderer.close_path()
 
+    # draws the template geoms once as a definition, then uses it for each of the affine matrices
+    def render_instances(self, template, matrices, primitive_renderer, template_attributes, definition_id):
+        template_renderer = GeometryRenderer(0, 0)
+
+        primitive_renderer.start_definition(definition_id)
+
+        for geom, attributes in zip(template, template_attributes):
+            template_renderer.render(geom, primitive_renderer, attributes)
+
+        primitive_renderer.end_definition()
+
+        offset = translation_affine(self._x_offset, self._y_offset)
+
+        for matrix in matrices:
+            primitive_renderer.use_definition(definition_id, compose_affine(matrix, offset))
+
 
 class GroupRenderer:
 
@@ -221,26 +508,48 @@ class GroupRenderer:
 class RenderBuilder:
 
 
+    # names of the cairo.SVGUnit for each unit, resolved when rendering so cairo is
+    # only imported when needed
     SVG_UNIT_MAP = {
-        "user": cairo.SVGUnit.USER,
-        "em": cairo.SVGUnit.EM,
-        "ex": cairo.SVGUnit.EX,
-        "px": cairo.SVGUnit.PX,
-        "in": cairo.SVGUnit.IN,
-        "inches": cairo.SVGUnit.IN,
-        "cm": cairo.SVGUnit.CM,
-        "mm": cairo.SVGUnit.MM,
-        "pt": cairo.SVGUnit.PT,
-        "pc": cairo.SVGUnit.PC,
-        "percent": cairo.SVGUnit.PERCENT,
+        "user": "USER",
+        "em": "EM",
+        "ex": "EX",
+        "px": "PX",
+        "in": "IN",
+        "inches": "IN",
+        "cm": "CM",
+        "mm": "MM",
+        "pt": "PT",
+        "pc": "PC",
+        "percent": "PERCENT",
+    }
+
+    # used for the default simplification tolerance
+    UNITS_PER_MM = {
+        "user": 96 / 25.4,
+        "px": 96 / 25.4,
+        "in": 1 / 25.4,
+        "inches": 1 / 25.4,
+        "cm": 0.1,
+        "mm": 1,
+        "pt": 72 / 25.4,
+        "pc": 6 / 25.4,
     }
 
+    # finest detail reproduced when simplifying without a tolerance or kerf
+    DEFAULT_SIMPLIFY_MM = 0.01
+
     def __init__(self):
         self._fill_background = True
         self._filename = None
         self._append_dimensions_to_file_name = False
         self._output_format = None
+        self._streaming = False
         self._units = "pt"
+        self._use_instances = True
+        self._simplify = False
+        self._simplify_tolerance = None
+        self._kerf = None
 
         self._pre_render_callback = lambda geom_renderer, primitive_renderer: None
         self._post_render_callback = lambda geom_renderer, primitive_renderer: None
@@ -249,8 +558,11 @@ class RenderBuilder:
         self._filename = filename
         return self
 
-    def svg(self):
+    # if streaming, SVG is written directly to the output file as the group is drawn,
+    # without cairo, see StreamingSVGPrimitiveRenderer
+    def svg(self, streaming=False):
         self._output_format = "svg"
+        self._streaming = streaming
         return self
 
     def units_mm(self):
@@ -271,6 +583,31 @@ class RenderBuilder:
         self._fill_background = on
         return self
 
+    # if on, instanced groups (see Group.instance) are drawn by reusing a single copy
+    # of their geometry, where the output format allows
+    def use_instances(self, on=True):
+        self._use_instances = on
+        return self
+
+    # Simplifies groups before rendering, see Group.simplify_for_output. tolerance is in
+    # render units, by default a tenth of kerf (the width of the cut, in render units)
+    # if given, otherwise DEFAULT_SIMPLIFY_MM.
+    def simplify(self, tolerance=None, kerf=None, on=True):
+        self._simplify = on
+        self._simplify_tolerance = tolerance
+        self._kerf = kerf
+        return self
+
+    def _get_simplify_tolerance(self):
+        if self._simplify_tolerance is not None:
+            return self._simplify_tolerance
+        elif self._kerf is not None:
+            return self._kerf / 10
+        elif self._units in RenderBuilder.UNITS_PER_MM:
+            return RenderBuilder.DEFAULT_SIMPLIFY_MM * RenderBuilder.UNITS_PER_MM[self._units]
+        else:
+            raise ValueError(f"No default simplification tolerance for units: {self._units}")
+
     def pre_render_callback(self, pre_render_callback):
         self._pre_render_callback = pre_render_callback
         return self
@@ -292,13 +629,22 @@ class RenderBuilder:
             if self._units not in RenderBuilder.SVG_UNIT_MAP.keys():
                 raise ValueError(f"Unknown unit for {self._output_format}: {self._units}")
 
-            return RenderBuilder.SVG_UNIT_MAP[self._units]
+            import cairo
+
+            return getattr(cairo.SVGUnit, RenderBuilder.SVG_UNIT_MAP[self._units])
         else:
             raise NotImplementedError()
 
     def _get_primitive_renderer(self, group):
         if self._output_format is None:
             raise ValueError("No output format specified")
+        elif self._output_format == "svg" and self._streaming:
+            return StreamingSVGPrimitiveRenderer(
+                self._get_output_file_path(group),
+                group.bounds_width,
+                group.bounds_height,
+                self._fill_background,
+                units=self._units)
         elif self._output_format == "svg":
             return SVGPrimitiveRenderer(
                 self._get_output_file_path(group),
@@ -311,22 +657,67 @@ class RenderBuilder:
     def _get_geom_renderer(group):
         return GeometryRenderer(-group.bounds_x, -group.bounds_y)
 
+    # returns false, having drawn nothing, if the instances can't share a definition
+    # as they aren't all drawn the same way
+    @staticmethod
+    def _render_instances(group, instances, geometry_renderer, primitive_renderer):
+        template, matrices = instances
+
+        gm = group.geom_attributes_manager
+        geom_count = len(template) * len(matrices)
+
+        attribute_values = [
+            list(gm.iter_geom_attribute(k, geom_count, v)) for k, v in GeometryRenderer.RENDER_ATTRIBUTE_DEFAULTS.items()]
+
+        if any(values != values[:len(template)] * len(matrices) for values in attribute_values):
+            return False
+
+        template_attributes = [
+            dict(zip(GeometryRenderer.RENDER_ATTRIBUTE_DEFAULTS.keys(), values))
+            for values in zip(*(v[:len(template)] for v in attribute_values))]
+
+        geometry_renderer.render_instances(template, matrices, primitive_renderer, template_attributes, "instance")
+
+        return True
+
+    @profiled
     def __call__(self, group):
+        result = group
+
+        if self._simplify:
+            group = group.simplify_for_output(self._get_simplify_tolerance())
+
         primitive_renderer = self._get_primitive_renderer(group)
         geometry_renderer = RenderBuilder._get_geom_renderer(group)
 
         primitive_renderer.init_canvas()
 
+        try:
+            self._render(group, geometry_renderer, primitive_renderer)
+        except BaseException:
+            primitive_renderer.abort_canvas()
+            raise
+
+        return result
+
+    def _render(self, group, geometry_renderer, primitive_renderer):
         self._pre_render_callback(geometry_renderer, primitive_renderer)
 
-        gm = group.geom_attributes_manager
+        instances = group.instances() if self._use_instances and primitive_renderer.SUPPORTS_DEFINITIONS else None
+
+        if instances is None or \
+                not RenderBuilder._render_instances(group, instances, geometry_renderer, primitive_renderer):
+            gm = group.geom_attributes_manager
+            geom_count = len(group.geoms.geoms)
 
-        for index, geom in enumerate(group.geoms.geoms):
-            attributes = gm.get_geom_attributes(index)
-            geometry_renderer.render(geom, primitive_renderer, attributes)
+            # read attributes a key at a time rather than materializing every geom's attribute dict
+            attribute_values = [
+                gm.iter_geom_attribute(k, geom_count, v) for k, v in GeometryRenderer.RENDER_ATTRIBUTE_DEFAULTS.items()]
+
+            for geom, *values in zip(group.geoms.geoms, *attribute_values):
+                attributes = dict(zip(GeometryRenderer.RENDER_ATTRIBUTE_DEFAULTS.keys(), values))
+                geometry_renderer.render(geom, primitive_renderer, attributes)
 
         self._post_render_callback(geometry_renderer, primitive_renderer)
 
         primitive_renderer.finish_canvas()
-
-        return group
@@ -0,0 +1,161 @@
+import json
+import mmap
+import struct
+
+import numpy as np
+import shapely as sh
+import shapely.geometry
+import shapely.wkb
+
+from .geom_attributes import MutableGeomAttributesManager, ColumnarGeomAttributesManager
+
+
+# Binary format used by Group.to_bytes and Group.from_bytes:
+#
+#   header      MAGIC, format version, geom type, attribute encoding, geometry length,
+#               attributes length, precision grid (0 if none, see Group.with_precision),
+#               packed as HEADER
+#   geometry    the group's multi geometry as a single WKB blob, so loading it creates
+#               no python objects per coordinate
+#   attributes  utf-8 JSON, see _encode_attributes
+#
+# Attribute values must be JSON compatible. Sequences are stored as JSON arrays and
+# always load as tuples, as colors and other attribute values usually are.
+
+MAGIC = b"SHRT"
+VERSION = 1
+HEADER = struct.Struct("<4sHBBQQd")
+
+GEOM_TYPES = [sh.geometry.MultiPolygon, sh.geometry.MultiLineString]
+
+ATTRIBUTES_PER_GEOM = 0
+ATTRIBUTES_COLUMNAR = 1
+
+
+def dumps(geoms, geom_attributes_manager, precision=None):
+    if type(geoms) not in GEOM_TYPES:
+        raise ValueError(f"Unsupported geom type: {type(geoms)}")
+
+    geometry = geoms.wkb
+
+    if isinstance(geom_attributes_manager, ColumnarGeomAttributesManager):
+        attribute_encoding = ATTRIBUTES_COLUMNAR
+    else:
+        attribute_encoding = ATTRIBUTES_PER_GEOM
+
+    attributes = json.dumps(
+        _encode_attributes(geom_attributes_manager), separators=(",", ":"), default=_encode_value).encode("utf-8")
+
+    header = HEADER.pack(
+        MAGIC, VERSION, GEOM_TYPES.index(type(geoms)), attribute_encoding, len(geometry), len(attributes),
+        precision or 0)
+
+    return b"".join((header, geometry, attributes))
+
+
+# returns (geoms, geom attributes manager, precision grid or None). data can be any
+# buffer, e.g. a memory map
+def loads(data):
+    data = memoryview(data)
+
+    if len(data) < HEADER.size:
+        raise ValueError("Data too short for a serialized group.")
+
+    magic, version, geom_type, attribute_encoding, geometry_length, attributes_length, precision = \
+        HEADER.unpack_from(data)
+
+    if magic != MAGIC:
+        raise ValueError("Data is not a serialized group.")
+
+    if version != VERSION:
+        raise ValueError(f"Unsupported serialized group version: {version}")
+
+    if len(data) < HEADER.size + geometry_length + attributes_length:
+        raise ValueError("Serialized group is truncated.")
+
+    geometry_start = HEADER.size
+    attributes_start = geometry_start + geometry_length
+
+    geoms = sh.wkb.loads(bytes(data[geometry_start:attributes_start]))
+
+    # shapely loads empty multi geometries as empty collections
+    if geoms.is_empty:
+        geoms = GEOM_TYPES[geom_type]([])
+
+    encoded_attributes = json.loads(str(data[attributes_start:attributes_start + attributes_length], "utf-8"))
+
+    if attribute_encoding == ATTRIBUTES_COLUMNAR:
+        geom_attributes_manager = _decode_columnar_attributes(encoded_attributes)
+    elif attribute_encoding == ATTRIBUTES_PER_GEOM:
+        geom_attributes_manager = _decode_attributes(encoded_attributes)
+    else:
+        raise ValueError(f"Unknown attribute encoding: {attribute_encoding}")
+
+    return geoms, geom_attributes_manager, precision if precision > 0 else None
+
+
+def dump(geoms, geom_attributes_manager, file_path, precision=None):
+    with open(file_path, "wb") as f:
+        f.write(dumps(geoms, geom_attributes_manager, precision))
+
+
+def load(file_path):
+    with open(file_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return loads(data)
+
+
+# Per geom attributes are stored as a list of distinct attribute dicts, each as a list
+# of [key, value] pairs, and [geom index, dict index] pairs, so geoms sharing a dict
+# share it again once loaded. Columnar attributes are stored as [key, runs] pairs, each
+# run being [start, stop, value].
+def _encode_attributes(geom_attributes_manager):
+    if isinstance(geom_attributes_manager, ColumnarGeomAttributesManager):
+        return [[key, [list(run) for run in runs]] for key, runs in geom_attributes_manager.column_runs]
+
+    dicts = []
+    dict_indices = dict()
+    geoms = []
+
+    for geom_index, attributes in geom_attributes_manager.shared_attributes:
+        if id(attributes) not in dict_indices:
+            dict_indices[id(attributes)] = len(dicts)
+            dicts.append([[k, v] for k, v in attributes.items()])
+
+        geoms.append([geom_index, dict_indices[id(attributes)]])
+
+    return {"attributes": dicts, "geoms": geoms}
+
+
+def _decode_attributes(encoded):
+    dicts = [{_to_tuples(k): _to_tuples(v) for k, v in pairs} for pairs in encoded["attributes"]]
+
+    result = MutableGeomAttributesManager()
+    for geom_index, dict_index in encoded["geoms"]:
+        result.add_shared_attributes(geom_index, dicts[dict_index])
+
+    return result.to_immutable()
+
+
+def _decode_columnar_attributes(encoded):
+    return ColumnarGeomAttributesManager.from_column_runs(
+        (_to_tuples(key), [(start, stop, _to_tuples(value)) for start, stop, value in runs])
+        for key, runs in encoded)
+
+
+def _encode_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    elif isinstance(value, np.ndarray):
+        return value.tolist()
+
+    raise ValueError(f"Attribute value can't be serialized: {value!r}")
+
+
+def _to_tuples(value):
+    if isinstance(value, list):
+        return tuple(_to_tuples(v) for v in value)
+    elif isinstance(value, dict):
+        return {k: _to_tuples(v) for k, v in value.items()}
+
+    return value
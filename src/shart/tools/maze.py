@@ -1,7 +1,5 @@
 import shapely.geometry
 
-import networkx as nx
-
 from shapely.geometry import LineString, MultiLineString
 
 import shart.renderers
@@ -57,6 +55,9 @@ class Maze:
         self.rows = rows
         self.columns = columns
 
+        # imported here as it's slow to load and only needed for mazes
+        import networkx as nx
+
         self.graph = nx.Graph()
 
         # Cell identifier is row * colcount + col
@@ -2,10 +2,14 @@ import shapely as sh
 import shapely.geometry
 import shapely.affinity
 import shapely.ops
+import shapely.strtree
+import shapely.validation
 
 import numpy as np
 
+import functools
 import math
+import warnings
 
 
 def get_interpolated_segment(line_string, interpolation):
@@ -42,8 +46,10 @@ def get_angles(line_string):
     return result
 
 def create_border_box(geom, border_thickness, border_radius):
-    b = geom.bounds
+    return border_box(geom.bounds, border_thickness, border_radius)
 
+
+def border_box(b, border_thickness, border_radius):
     result = sh.geometry.box(
             b[0] - border_thickness + border_radius,
             b[1] - border_thickness + border_radius,
@@ -80,22 +86,22 @@ def circular_array(center_point, geom, count, geom_centroid=None, should_rotate=
     if geom_centroid is None:
         geom_centroid = geom.centroid
 
-    r = math.hypot(geom_centroid.x - center_point.x, geom_centroid.y - center_point.y)
-
-    coords = circular_array_coords(r, count)
-
-    result = []
+    matrices = []
 
-    for coord in coords:
-        instance = geom
+    for a in np.linspace(0, 2 * math.pi, count, endpoint=False):
+        matrix = rotation_affine(a, center_point.x, center_point.y)
         if not should_rotate:
-            instance = sh.affinity.rotate(instance, -coord[2], origin=geom_centroid, use_radians=True)
-
-        instance = sh.affinity.rotate(instance, coord[2], origin=center_point, use_radians=True)
+            matrix = compose_affine(rotation_affine(-a, geom_centroid.x, geom_centroid.y), matrix)
 
-        result.append(instance)
+        matrices.append(matrix)
 
-    return result
+    if geom.type == "MultiPolygon" or geom.type == "MultiLineString":
+        return [type(geom)(c) for c in affine_copies(list(geom.geoms), matrices)]
+    elif geom.type in AFFINE_COPY_TYPES:
+        return [c[0] for c in affine_copies([geom], matrices)]
+    else:
+        # e.g. points and collections, transformed a copy at a time
+        return [sh.affinity.affine_transform(geom, m) for m in matrices]
 
 
 def flatten_geoms(polygons):
@@ -126,3 +132,267 @@ def ensure_multipolygon(p):
         raise ValueError(f"Cannot create multipolygon from type {p.type}")
     else:
         return sh.geometry.MultiPolygon([p])
+
+
+# affine matrices are stored in shapely's affine_transform order:
+# (a, b, d, e, xoff, yoff) for x' = a * x + b * y + xoff, y' = d * x + e * y + yoff
+IDENTITY_AFFINE = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+# returns the matrix applying first, then second
+def compose_affine(first, second):
+    a1, b1, d1, e1, x1, y1 = first
+    a2, b2, d2, e2, x2, y2 = second
+
+    return (
+        a2 * a1 + b2 * d1,
+        a2 * b1 + b2 * e1,
+        d2 * a1 + e2 * d1,
+        d2 * b1 + e2 * e1,
+        a2 * x1 + b2 * y1 + x2,
+        d2 * x1 + e2 * y1 + y2)
+
+
+def apply_affine(matrix, x, y):
+    a, b, d, e, xoff, yoff = matrix
+
+    return a * x + b * y + xoff, d * x + e * y + yoff
+
+
+def translation_affine(dx, dy):
+    return 1.0, 0.0, 0.0, 1.0, dx, dy
+
+
+def scale_affine(xfact, yfact, x0, y0):
+    return xfact, 0.0, 0.0, yfact, x0 - x0 * xfact, y0 - y0 * yfact
+
+
+# as shapely.affinity.rotate, angle in radians
+def rotation_affine(angle, x0, y0):
+    cosp = math.cos(angle)
+    sinp = math.sin(angle)
+
+    if abs(cosp) < 2.5e-16:
+        cosp = 0.0
+    if abs(sinp) < 2.5e-16:
+        sinp = 0.0
+
+    return cosp, -sinp, sinp, cosp, x0 - x0 * cosp + y0 * sinp, y0 - x0 * sinp - y0 * cosp
+
+
+# true if the matrix maps axis aligned boxes to axis aligned boxes
+def is_axis_aligned_affine(matrix):
+    return matrix[1] == 0 and matrix[2] == 0
+
+
+# true if the matrix only rotates, reflects, uniformly scales and translates,
+# which preserves the centroid of lines as well as areas
+def is_similarity_affine(matrix):
+    a, b, d, e = matrix[:4]
+
+    return (math.isclose(a, e) and math.isclose(b, -d, abs_tol=1e-12)) or \
+        (math.isclose(a, -e) and math.isclose(b, d, abs_tol=1e-12))
+
+
+# only valid for axis aligned matrices
+def transform_bounds(matrix, bounds):
+    x0, y0 = apply_affine(matrix, bounds[0], bounds[1])
+    x1, y1 = apply_affine(matrix, bounds[2], bounds[3])
+
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+
+# flattens the coordinates of simple (non multi) geoms into a single (n, 2)
+# array. The returned layout is used by geoms_from_coordinate_array to
+# rebuild geoms of the same shape from a transformed array.
+def coordinate_array(geoms):
+    arrays = []
+    layout = []
+
+    for g in geoms:
+        if g.is_empty:
+            layout.append((None, g))
+            continue
+
+        rings = [g.exterior] + list(g.interiors) if g.type == "Polygon" else [g]
+        ring_arrays = [np.asarray(r.coords)[:, :2] for r in rings]
+
+        arrays += ring_arrays
+        layout.append((g.type, [len(a) for a in ring_arrays]))
+
+    coords = np.concatenate(arrays) if len(arrays) > 0 else np.empty((0, 2))
+
+    return coords, layout
+
+
+def geoms_from_coordinate_array(coords, layout):
+    result = []
+    position = 0
+
+    for geom_type, ring_lengths in layout:
+        if geom_type is None:
+            result.append(ring_lengths)  # empty geom, stored as is
+            continue
+
+        rings = []
+        for length in ring_lengths:
+            rings.append(coords[position:position + length])
+            position += length
+
+        if geom_type == "Polygon":
+            result.append(sh.geometry.Polygon(rings[0], rings[1:]))
+        elif geom_type == "LineString":
+            result.append(sh.geometry.LineString(rings[0]))
+        elif geom_type == "LinearRing":
+            result.append(sh.geometry.LinearRing(rings[0]))
+        else:
+            raise ValueError(f"Unsupported geom type: {geom_type}")
+
+    return result
+
+
+# geom types supported by affine_copies
+AFFINE_COPY_TYPES = ["Polygon", "LineString", "LinearRing"]
+
+
+# applies every affine matrix to the simple geoms using a single numpy
+# operation, returning a list of transformed geoms for each matrix
+def affine_copies(geoms, matrices):
+    coords, layout = coordinate_array(geoms)
+
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 6)
+    linear = matrices[:, :4].reshape(-1, 2, 2)
+    offsets = matrices[:, 4:]
+
+    copies = np.einsum("kij,nj->kni", linear, coords) + offsets[:, np.newaxis, :]
+
+    return [geoms_from_coordinate_array(c, layout) for c in copies]
+
+
+# bounds of the simple geoms transformed by each of the affine matrices, found from
+# the corners of their convex hull
+def instance_bounds(geoms, matrices):
+    hull = sh.geometry.GeometryCollection(list(geoms)).convex_hull
+    if hull.type == "Polygon":
+        coords = np.asarray(hull.exterior.coords)
+    else:
+        coords = np.asarray(hull.coords)
+
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 6)
+
+    xs = matrices[:, 0:1] * coords[:, 0] + matrices[:, 1:2] * coords[:, 1] + matrices[:, 4:5]
+    ys = matrices[:, 2:3] * coords[:, 0] + matrices[:, 3:4] * coords[:, 1] + matrices[:, 5:6]
+
+    return xs.min(), ys.min(), xs.max(), ys.max()
+
+
+# STRtree over the geoms, returning their indices from query_items
+def spatial_index(geoms):
+    with warnings.catch_warnings():
+        # shapely 1.8 warns that the items argument changes in 2.0
+        warnings.simplefilter("ignore")
+        return sh.strtree.STRtree(geoms, range(0, len(geoms)))
+
+
+# closed ring of segment_count + 1 points on the unit circle, starting at (1, 0) and
+# running clockwise as shapely's buffer does. Cached and shared, so read only.
+@functools.lru_cache(maxsize=256)
+def unit_circle_ring(segment_count):
+    angles = -2 * math.pi * np.arange(segment_count + 1) / segment_count
+
+    ring = np.column_stack((np.cos(angles), np.sin(angles)))
+    ring[-1] = ring[0]
+    ring.setflags(write=False)
+
+    return ring
+
+
+# smallest segment count, a multiple of 4 so the polygon stays symmetric about both
+# axes, for which a polygon inscribed in a circle of the supplied radius is never
+# further than tolerance from the circle
+def circle_segment_count(radius, tolerance):
+    if tolerance <= 0:
+        raise ValueError(f"Tolerance must be positive: {tolerance}")
+
+    if tolerance >= radius:
+        return 4
+
+    # the furthest point of each segment (its middle) is radius * (1 - cos(pi / n)) from the circle
+    segment_count = math.pi / math.acos(1 - tolerance / radius)
+
+    return 4 * math.ceil(segment_count / 4)
+
+
+# Key identifying a simple geom by its coordinates rounded to multiples of tolerance,
+# which is the same for copies of a ring starting at a different vertex or running in
+# the other direction, and for reversed lines. Coordinates within tolerance of each
+# other almost always round the same way, but can fall either side of a multiple.
+def geom_key(geom, tolerance):
+    if geom.is_empty:
+        return geom.type.encode("utf-8")
+
+    if geom.type == "Polygon":
+        interiors = sorted(_coords_key(np.asarray(r.coords), tolerance, True) for r in geom.interiors)
+        return b"|".join([b"Polygon", _coords_key(np.asarray(geom.exterior.coords), tolerance, True)] + interiors)
+
+    return b"|".join([geom.type.encode("utf-8"), _coords_key(np.asarray(geom.coords), tolerance, geom.is_ring)])
+
+
+def _coords_key(coords, tolerance, closed):
+    rounded = np.round(coords[:, :2] / tolerance).astype("<i8")
+
+    # drop vertices which round onto the previous one, and the closing vertex of rings
+    keep = np.ones(len(rounded), dtype=bool)
+    keep[1:] = np.any(rounded[1:] != rounded[:-1], axis=1)
+    rounded = rounded[keep]
+
+    if closed and len(rounded) > 1 and np.array_equal(rounded[0], rounded[-1]):
+        rounded = rounded[:-1]
+
+    candidates = [rounded, rounded[::-1]]
+
+    if closed:
+        # start both directions at the lowest vertex
+        candidates = [np.roll(c, -np.lexsort((c[:, 1], c[:, 0]))[0], axis=0) for c in candidates]
+
+    return min(np.ascontiguousarray(c).tobytes() for c in candidates)
+
+
+# Snaps the coordinates of simple geoms to multiples of grid. Returns a list for each
+# geom of the valid geoms of the same dimension it became, as snapping can collapse
+# or split polygons and collapse lines.
+def snap_to_grid(geoms, grid):
+    coords, layout = coordinate_array(geoms)
+    snapped = geoms_from_coordinate_array(np.round(coords / grid) * grid, layout)
+
+    result = []
+
+    for original, g in zip(geoms, snapped):
+        if g.is_empty:
+            result.append([])
+            continue
+
+        if not g.is_valid:
+            g = sh.validation.make_valid(g)
+
+        dimension = 2 if original.type == "Polygon" else 1
+        result.append([p for p in _simple_geoms(g) if _dimension(p) == dimension and not p.is_empty])
+
+    return result
+
+
+def _simple_geoms(geom):
+    if hasattr(geom, "geoms"):
+        return [p for g in geom.geoms for p in _simple_geoms(g)]
+
+    return [geom]
+
+
+def _dimension(geom):
+    if geom.type == "Polygon":
+        return 2 if geom.area > 0 else None
+    elif geom.type in ("LineString", "LinearRing"):
+        return 1 if geom.length > 0 else None
+
+    return 0
+
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from shart import bench
+
+
+IMPORT_BUDGET_SECONDS = 1.0
+
+
+class TestBench(unittest.TestCase):
+
+    def test_run(self):
+        results = bench.run(["finger-joint-phases", "turtle-fork"], scale=1, repeat=1)
+
+        self.assertEqual(1, results["scale"])
+        self.assertListEqual(["finger-joint-phases", "turtle-fork"], list(results["results"]))
+
+        result = results["results"]["turtle-fork"]
+        self.assertEqual(364, result["parts"])
+        self.assertEqual(728, result["vertices"])
+        self.assertGreater(result["seconds"], 0)
+        self.assertGreater(result["peak_bytes"], 0)
+
+        with self.assertRaises(ValueError):
+            bench.run(["unknown"])
+
+    def test_compare(self):
+        baseline = bench.run(["turtle-fork"], scale=1, repeat=1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "baseline.json")
+            bench.save(baseline, file_path)
+            baseline = bench.load(file_path)
+
+        self.assertListEqual([], bench.compare(baseline, baseline))
+
+        slower = {**baseline, "results": {"turtle-fork": {**baseline["results"]["turtle-fork"]}}}
+        slower["results"]["turtle-fork"]["seconds"] += 1
+        slower["results"]["turtle-fork"]["vertices"] += 2
+
+        self.assertListEqual(["seconds", "vertices"], [d[1] for d in bench.compare(slower, baseline)])
+
+        with self.assertRaises(ValueError):
+            bench.compare({**baseline, "scale": 2}, baseline)
+
+    def test_import_time(self):
+        # worker processes pay for this, slow optional dependencies are imported when used
+        self.assertLess(bench.import_seconds("shart.group"), IMPORT_BUDGET_SECONDS)
+
+        code = "import sys, shart.group, shart.renderers, shart.tools.maze; " \
+               "print(' '.join(m for m in ['cairo', 'defusedxml', 'networkx'] if m in sys.modules))"
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+
+        self.assertEqual("", subprocess.run([sys.executable, "-c", code], env=environment, check=True,
+                                            capture_output=True, text=True).stdout.strip())
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import shart
+from shart.cache import DiskCache
+from shart.group import Group
+
+
+# modifiers record their calls here, outside of their closures which are part of the cache key
+calls = []
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+        self._directory = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(self._directory.name, 1024 * 1024)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_do_cached(self):
+        def grow(amount):
+            def modifier(g):
+                calls.append(amount)
+                return g.buffer(amount).add_geom_attribute("grown", amount)
+
+            return modifier
+
+        group = Group.rect(0, 0, 10, 10)
+
+        first = group.do_cached(grow(1), cache=self.cache)
+        second = group.do_cached(grow(1), cache=self.cache)
+
+        self.assertEqual([1], calls)
+        self.assertTrue(first.geoms.equals_exact(second.geoms, 0))
+        self.assertDictEqual(dict(first.geom_attributes_manager.attributes), dict(second.geom_attributes_manager.attributes))
+
+        # a different closure, input group or key is a different result
+        group.do_cached(grow(2), cache=self.cache)
+        group.translate(1, 0).do_cached(grow(1), cache=self.cache)
+        group.do_cached(grow(1), key="v2", cache=self.cache)
+
+        self.assertEqual([1, 2, 1, 1], calls)
+
+    def test_precision(self):
+        def cut(g):
+            return g.difference(Group.rect(1e-9, 0, 10, 10))
+
+        square = Group.rect(0, 0, 10, 10)
+
+        self.assertEqual(1, len(square.do_cached(cut, cache=self.cache).geoms.geoms))
+
+        precise = square.with_precision(0.001).do_cached(cut, cache=self.cache)
+        self.assertEqual(0, len(precise.geoms.geoms))
+        self.assertEqual(0.001, square.with_precision(0.001).do_cached(cut, cache=self.cache)._precision)
+
+    def test_captured_arrays(self):
+        def shift(offsets):
+            def modifier(g):
+                calls.append(offsets[500])
+                return g.translate(offsets[500], 0)
+
+            return modifier
+
+        a = np.zeros(10000)
+        b = np.zeros(10000)
+        b[500] = 5
+
+        group = Group.rect(0, 0, 1, 1)
+
+        self.assertEqual((0, 0, 1, 1), group.do_cached(shift(a), cache=self.cache).bounds)
+        self.assertEqual((5, 0, 6, 1), group.do_cached(shift(b), cache=self.cache).bounds)
+        self.assertEqual((5, 0, 6, 1), group.do_cached(shift(b.copy()), cache=self.cache).bounds)
+        self.assertEqual([0, 5], calls)
+
+        # values without contents to identify them can't be part of a key
+        with self.assertRaises(ValueError):
+            group.do_cached(shift(object()), cache=self.cache)
+
+    def test_cached_decorator(self):
+        @shart.cached(cache=self.cache)
+        def grow(g, amount):
+            calls.append(amount)
+            return g.buffer(amount)
+
+        group = Group.rect(0, 0, 10, 10)
+
+        grow(group, 1)
+        grow(group, 1)
+        grow(group, 2)
+
+        self.assertEqual([1, 2], calls)
+
+        with self.assertRaises(ValueError):
+            shart.cache.call_cached(group, lambda g: 1, cache=self.cache)
+
+    def test_eviction(self):
+        cache = DiskCache(self._directory.name, 250)
+
+        for i in range(5):
+            cache.put(f"key{i}", bytes(100))
+
+        self.assertEqual(2, len(os.listdir(self._directory.name)))
+        self.assertIsNone(cache.get("key0"))
+        self.assertIsNotNone(cache.get("key4"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,6 +11,7 @@ import numpy.testing
 
 import shart
 from shart.box import *
+from shart.geom_attributes import GeomAttributesManager, MutableGeomAttributesManager, ColumnarGeomAttributesManager
 
 
 class TestMain(unittest.TestCase):
@@ -71,6 +72,32 @@ class TestMain(unittest.TestCase):
             {0: {"g": "g1_val"}},
             dict(g_union.geom_attributes_manager.attributes))
 
+    def test_union_by_attribute(self):
+        red = Group.rect(0, 0, 10, 10).add(Group.rect(5, 5, 10, 10)).add_geom_attribute("color", (1, 0, 0))
+        blue = Group.rect(8, 0, 10, 10).add_geom_attribute("color", (0, 0, 1))
+
+        g_union = red.add(blue).union(attribute_key="color")
+
+        self.assertEqual(2, len(g_union.geoms.geoms))
+        self.assertEqual(175, g_union.geoms.geoms[0].area)
+        self.assertDictEqual(
+            {0: {"color": (1, 0, 0)}, 1: {"color": (0, 0, 1)}},
+            dict(g_union.geom_attributes_manager.attributes))
+
+    def test_union_by_unhashable_attribute(self):
+        red = Group.rect(0, 0, 10, 10).add_geom_attribute("color", [1, 0, 0])
+        also_red = Group.rect(5, 5, 10, 10).add_geom_attribute("color", [1, 0, 0])
+        blue = Group.rect(8, 0, 10, 10).add_geom_attribute("color", [0, 0, 1])
+
+        g_union = red.add(also_red).add(blue).union(attribute_key="color")
+
+        self.assertEqual(2, len(g_union.geoms.geoms))
+        self.assertEqual(175, g_union.geoms.geoms[0].area)
+        self.assertEqual([1, 0, 0], g_union.geom_attributes_manager.get_geom_attribute(0, "color"))
+
+        with self.assertRaises(ValueError):
+            red.add_geom_attribute("color", bytearray(b"red")).union(attribute_key="color")
+
     def test_multiple_attributes(self):
         g0 = Group.rect(0, 0, 100, 100).add_geom_attribute("a", "aval").add_geom_attribute("b", "bval")
 
@@ -88,3 +115,89 @@ class TestMain(unittest.TestCase):
             {0: {"a": "aval", "b": "newbval"}},
             dict(g0.geom_attributes_manager.attributes))
 
+    def test_offset_keys(self):
+        gam = GeomAttributesManager({0: {"a": 0}, 1: {"a": 1}}).offset_keys(2).offset_keys(3)
+
+        self.assertDictEqual({5: {"a": 0}, 6: {"a": 1}}, dict(gam.attributes))
+        self.assertDictEqual({"a": 1}, gam.get_geom_attributes(6))
+        self.assertDictEqual({}, gam.get_geom_attributes(1))
+        self.assertDictEqual({0: {"a": 0}}, dict(gam.extract_index(5).attributes))
+
+    def test_attributes_not_shared_between_managers(self):
+        source = {0: {"a": 0}}
+        gam = GeomAttributesManager(source)
+        source[0]["a"] = 1
+
+        gam.get_geom_attributes(0)["a"] = 2
+        for k, v in gam.attributes:
+            v["a"] = 3
+
+        updated = gam.add_geom_attribute(0, "a", 4)
+
+        mutable = MutableGeomAttributesManager.copy(gam)
+        mutable.add_attribute(0, "a", 5)
+
+        self.assertDictEqual({0: {"a": 0}}, dict(gam.attributes))
+        self.assertDictEqual({0: {"a": 4}}, dict(updated.attributes))
+        self.assertDictEqual({0: {"a": 5}}, dict(mutable.to_immutable().attributes))
+
+    def test_add_geom_attribute_for_indices(self):
+        gam = GeomAttributesManager({1: {"a": 1}})\
+            .add_geom_attribute_for_indices(range(3), "b", 2)
+
+        self.assertDictEqual(
+            {0: {"b": 2}, 1: {"a": 1, "b": 2}, 2: {"b": 2}},
+            dict(gam.attributes))
+
+    def test_columnar_attributes(self):
+        g = Group.rect(0, 0, 1, 1)\
+            .linarray(5, lambda i, g: g.translate(i * 2, 0))\
+            .with_columnar_attributes()\
+            .add_geom_attribute("fill", True)
+        g = g.add(Group.rect(20, 0, 1, 1).add_geom_attribute("color", (1, 0, 0)))
+
+        gam = g.geom_attributes_manager
+
+        self.assertIsInstance(gam, ColumnarGeomAttributesManager)
+        self.assertEqual([True] * 5 + [False], list(gam.iter_geom_attribute("fill", 6, False)))
+        self.assertDictEqual({"color": (1, 0, 0)}, gam.get_geom_attributes(5))
+        self.assertDictEqual({3: {"fill": True}}, dict(gam.extract_index(3).offset_keys(3).attributes))
+
+    def test_columnar_array_values(self):
+        red = np.array([1.0, 0, 0])
+        colors = [red, red, np.array([0, 0, 1.0]), np.array([1.0, 0, 0])]
+
+        g = Group().add_all(
+            Group.rect(i * 2, 0, 1, 1).add_geom_attribute("color", c) for i, c in enumerate(colors))\
+            .with_columnar_attributes()
+
+        gam = g.geom_attributes_manager
+
+        for expected, value in zip(colors, gam.iter_geom_attribute("color", 4)):
+            np.testing.assert_array_equal(expected, value)
+
+        # equal arrays share a run
+        self.assertEqual(3, len(dict(gam.column_runs)["color"]))
+
+    def test_columnar_filter_and_explode(self):
+        g = Group.rect(0, 0, 1, 1).add_geom_attribute("a", 0)\
+            .add(Group.rect(2, 0, 2, 2).add_geom_attribute("a", 1))\
+            .add(Group.rect(5, 0, 1, 1).add_geom_attribute("a", 2))\
+            .with_columnar_attributes()
+
+        filtered = g.filter(lambda p: p.bounds_width == 1)
+
+        self.assertDictEqual({0: {"a": 0}, 1: {"a": 2}}, dict(filtered.geom_attributes_manager.attributes))
+        self.assertEqual(
+            [{0: {"a": 0}}, {0: {"a": 1}}, {0: {"a": 2}}],
+            [dict(p.geom_attributes_manager.attributes) for p in g.explode()])
+
+    def test_columnar_union_key_collision(self):
+        gam = ColumnarGeomAttributesManager({0: {"a": 0}, 1: {"a": 1}})
+
+        with self.assertRaises(ValueError):
+            gam.union(ColumnarGeomAttributesManager({1: {"b": 0}}))
+
+        self.assertDictEqual(
+            {0: {"a": 0}, 1: {"a": 1}, 2: {"b": 0}},
+            dict(gam.union(GeomAttributesManager({2: {"b": 0}})).attributes))
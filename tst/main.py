@@ -1,11 +1,20 @@
+import math
+import sys
+import types
 import unittest
-from unittest.mock import Mock, MagicMock
+from unittest.mock import Mock, MagicMock, patch
 
 import shapely as sh
 import shapely.geometry
+import shapely.affinity
 
 import shart
-from shart.group import Group
+from shart.geom_attributes import GeomAttributesManager
+from shart.group import Group, GroupBuilder, _glyph_outline
+
+def halve(g):
+    return [g.scale(0.5, origin=(0, 0)), g.scale(0.5, origin=(0, 0)).translate(g.bounds_width / 2, 0)]
+
 
 class TestMain(unittest.TestCase):
 
@@ -41,6 +50,71 @@ class TestMain(unittest.TestCase):
     def test_bounds_height(self):
         self.assertEqual(3, Group.rect_centered(0, 0, 2, 3).bounds_height)
 
+    def test_cached_measurements(self):
+        g = Group.rect(0, 0, 2, 4)
+
+        self.assertEqual((0, 0, 2, 4), g.bounds)
+        self.assertEqual((1, 2), g.centroid)
+        self.assertEqual(8, g.area)
+
+        transformed = g.translate(1, 1).scale(2, 1, origin=(0, 0))
+
+        # derived from the cached values without applying the transform
+        self.assertIsNotNone(transformed._bounds_cache)
+        self.assertIsNotNone(transformed._transform)
+
+        self.assertEqual((2, 1, 6, 5), transformed.bounds)
+        self.assertEqual((4, 3), transformed.centroid)
+        self.assertEqual(16, transformed.area)
+        self.assertEqual(transformed.bounds, transformed.geoms.bounds)
+
+    def test_predicates(self):
+        cells = Group().add_all(Group.rect(x, 0, 1, 1) for x in range(0, 10, 2))
+        container = Group.rect(-1, -1, 5, 3).add(Group.rect(20, 20, 1, 1))
+
+        self.assertTrue(container.covers(cells.filter(lambda g: g.bounds_x < 3)))
+        self.assertFalse(container.covers(cells))
+        self.assertTrue(cells.intersects(Group.rect(8.5, 0.5, 5, 5)))
+        self.assertFalse(cells.intersects(Group.rect(1.2, 0.2, 0.5, 0.5)))
+
+        self.assertEqual(3, len(cells.difference(container).geoms.geoms))
+        self.assertEqual(2, len(cells.intersection(container).geoms.geoms))
+
+    def test_parallel_difference(self):
+        cells = Group().add_all(Group.rect(x, 0, 1, 1).add_geom_attribute("x", x) for x in range(0, 20, 2))
+        cut = Group.rect(3.5, -1, 5, 3)
+
+        serial = cells.difference(cut)
+        parallel = cells.difference(cut, workers=2)
+
+        self.assertTrue(serial.geoms.equals(parallel.geoms))
+        self.assertDictEqual(
+            dict(serial.geom_attributes_manager.attributes),
+            dict(parallel.geom_attributes_manager.attributes))
+
+        self.assertTrue(cells.intersection(cut).geoms.equals(cells.intersection(cut, workers=2).geoms))
+
+    def test_parallel_union(self):
+        cells = Group().add_all(Group.rect(x, y, 1.5, 1.5) for x in range(0, 10) for y in range(0, 10))
+
+        serial = cells.union()
+        parallel = cells.union(workers=2)
+
+        self.assertEqual(1, len(parallel.geoms.geoms))
+        self.assertTrue(serial.geoms.equals(parallel.geoms))
+
+        # classes share a single process pool, tiny classes are unioned in this process
+        coloured = cells.add_geom_attribute("color", (1, 0, 0))\
+            .add(cells.translate(20, 0).add_geom_attribute("color", (0, 1, 0)))\
+            .add(Group.rect(40, 0, 1, 1).add_geom_attribute("color", (0, 0, 1)))
+
+        with patch("shart.parallel._executor", wraps=shart.parallel._executor) as executor:
+            parallel = coloured.union(attribute_key="color", workers=2)
+
+        self.assertEqual(1, executor.call_count)
+        self.assertTrue(coloured.union(attribute_key="color").geoms.equals(parallel.geoms))
+        self.assertEqual((0, 0, 1), parallel.geom_attributes_manager.get_geom_attribute(2, "color"))
+
     def test_recurse(self):
         geom = Group.rect(0, 0, 10, 10)
 
@@ -55,6 +129,255 @@ class TestMain(unittest.TestCase):
 
         #self.assertEqual(7, len(recursed.geoms.geoms))
 
+    def test_transform_chain(self):
+        geom = sh.geometry.box(0, 0, 10, 5)
+
+        expected = sh.affinity.translate(geom, 3, 4)
+        expected = sh.affinity.rotate(expected, 30, origin='centroid')
+        expected = sh.affinity.scale(expected, 2, 3, origin='center')
+        expected = sh.affinity.rotate(expected, 0.5, origin=(1, 1), use_radians=True)
+
+        g = Group.from_geomarray([geom])\
+            .translate(3, 4)\
+            .rotate(30, use_radians=False)\
+            .scale(2, 3)\
+            .rotate(0.5, origin=(1, 1))
+
+        self.assertTrue(g.geoms.geoms[0].equals_exact(expected, 1e-9))
+
+    def test_transform_preserves_attributes(self):
+        g = Group.rect(0, 0, 1, 1).add_geom_attribute("a", 0).translate(1, 1).rotate(1)
+
+        self.assertDictEqual({0: {"a": 0}}, dict(g.geom_attributes_manager.attributes))
+
+    def test_spin(self):
+        g = Group.rect_centered(50, 0, 10, 10).add_geom_attribute("a", 0).spin(0, 0, 4)
+
+        self.assertEqual(4, len(g.geoms.geoms))
+        self.assertTrue(g.geoms.geoms[1].equals(sh.geometry.box(-5, 45, 5, 55)))
+        self.assertEqual(4, len(dict(g.geom_attributes_manager.attributes)))
+
+    def test_explode_views(self):
+        g = Group.rect(0, 0, 1, 1).add_geom_attribute("a", 1).add(Group.rect(2, 0, 1, 1))
+        parts = list(g.explode())
+
+        self.assertEqual(2, len(parts))
+        self.assertEqual((2, 0, 3, 1), parts[1].bounds)
+        self.assertEqual((2, 1, 3, 2), parts[1].translate(0, 1).bounds)
+        self.assertDictEqual({0: {"a": 1}}, dict(parts[0].geom_attributes_manager.attributes))
+        self.assertEqual(shapely.geometry.MultiPolygon, type(parts[0].geoms))
+
+        mapped = g.map_subgroups(lambda p: p.add(p.translate(0, 2)))
+        self.assertEqual(4, len(mapped.geoms.geoms))
+        self.assertDictEqual({0: {"a": 1}, 1: {"a": 1}}, dict(mapped.geom_attributes_manager.attributes))
+
+    def test_recurse_by_level(self):
+        g = Group.rect(0, 0, 8, 8)
+
+        self.assertEqual(1 + 2 + 4 + 8, len(g.recurse(halve, 3).geoms.geoms))
+        self.assertEqual(1 + 2 + 4, len(g.recurse(halve, 3, prune=lambda s: s.bounds_width < 2).geoms.geoms))
+        self.assertEqual([4, 4, 2, 2, 2, 2], [s.bounds_width for s in g.iter_recurse(halve, 2)])
+
+        serial = g.recurse(halve, 3).geoms.geoms
+        parallel = g.recurse(halve, 3, workers=2).geoms.geoms
+        self.assertTrue(all(a.equals_exact(b, 1e-9) for a, b in zip(serial, parallel)))
+
+    def test_circle(self):
+        circle = Group.circle(3, 4, 10)
+        buffered = sh.geometry.Point(3, 4).buffer(5, resolution=15)
+
+        self.assertTrue(circle.geoms.geoms[0].exterior.equals_exact(buffered.exterior, 1e-9))
+
+        fine = Group.circle(0, 0, 100, tolerance=0.01).geoms.geoms[0]
+        self.assertEqual(0, (len(fine.exterior.coords) - 1) % 4)
+        self.assertLess(sh.geometry.Point(0, 0).buffer(50, 256).hausdorff_distance(fine), 0.01)
+
+        circles = Group.circles([(0, 0), (10, 0), (20, 0)], 4)
+        self.assertEqual(3, len(circles.geoms.geoms))
+        self.assertEqual((18, -2, 22, 2), circles.geoms.geoms[2].bounds)
+
+    def test_regular_polygon(self):
+        square = Group.regular_polygon(1, 1, math.sqrt(2), 4, angle=math.pi / 4)
+
+        self.assertAlmostEqual(4, square.area)
+        self.assertEqual((0, 0, 2, 2), tuple(round(b, 9) for b in square.bounds))
+
+    def test_instance(self):
+        template = Group.rect_centered(0, 0, 2, 2).add_geom_attribute("a", 1)
+        coordinates = [(0, 0), (10, 0), (10, 10)]
+
+        instanced = template.instance_at(coordinates).rotate(90, origin=(0, 0), use_radians=False)
+        expanded = Group().add_all(template.to(x, y).add_geom_attribute("a", 1) for x, y in coordinates)\
+            .rotate(90, origin=(0, 0), use_radians=False)
+
+        self.assertEqual(3, len(instanced.instances()[1]))
+        self.assertEqual(tuple(round(b, 9) for b in expanded.bounds), tuple(round(b, 9) for b in instanced.bounds))
+        self.assertAlmostEqual(expanded.area, instanced.area)
+        self.assertAlmostEqual(expanded.centroid[0], instanced.centroid[0])
+
+        self.assertTrue(expanded.geoms.equals(instanced.geoms))
+        self.assertIsNone(instanced.instances())
+        self.assertDictEqual(dict(expanded.geom_attributes_manager.attributes),
+                             dict(instanced.geom_attributes_manager.attributes))
+
+        spun = template.spin(0, 0, 4, instanced=True)
+        self.assertEqual(4, len(spun.instances()[1]))
+        self.assertEqual(8, len(spun.instance_at([(0, 0), (20, 0)]).geoms.geoms))
+
+    def test_dedupe(self):
+        square = Group.rect_centered(0, 0, 2, 2)
+
+        # coincident copies, each starting at a different vertex
+        self.assertEqual(1, len(square.spin(0, 0, 4, should_rotate=True).dedupe().geoms.geoms))
+        self.assertEqual(5, len(square.spin(0, 0, 5, should_rotate=True).dedupe().geoms.geoms))
+
+        nearly = square.add(square.translate(1e-9, 0)).add(square.translate(1, 0))
+        self.assertEqual(2, len(nearly.dedupe(tolerance=1e-6).geoms.geoms))
+
+        colored = square.add_geom_attribute("color", (1, 0, 0)).add(square)
+        self.assertEqual(2, len(colored.dedupe().geoms.geoms))
+        self.assertDictEqual({0: {"color": (1, 0, 0)}},
+                             dict(colored.dedupe(ignore_attributes=True).geom_attributes_manager.attributes))
+
+    def test_content_hash(self):
+        square = Group.rect_centered(0, 0, 2, 2)
+
+        self.assertEqual(square.content_hash(), Group.rect_centered(0, 0, 2, 2).content_hash())
+        self.assertEqual(square.content_hash(), square.rotate(90, use_radians=False).content_hash())
+        self.assertNotEqual(square.content_hash(), square.translate(1, 0).content_hash())
+        self.assertNotEqual(square.content_hash(), square.add_geom_attribute("fill", True).content_hash())
+
+        # an empty attributes entry is the same as none
+        empty_attributes = Group(square.geoms, GeomAttributesManager({0: {}}))
+        self.assertEqual(square.content_hash(), empty_attributes.content_hash())
+        self.assertEqual(1, len(empty_attributes.add(square).dedupe().geoms.geoms))
+
+    def test_simplify_for_output(self):
+        circle = Group.circle(0, 0, 100).add_geom_attribute("fill", True)
+        simplified = circle.simplify_for_output(0.1)
+
+        self.assertLess(len(simplified.geoms.geoms[0].exterior.coords), len(circle.geoms.geoms[0].exterior.coords) / 4)
+        self.assertLess(circle.geoms.hausdorff_distance(simplified.geoms), 0.1)
+        self.assertDictEqual({0: {"fill": True}}, dict(simplified.geom_attributes_manager.attributes))
+
+        instanced = Group.circle(0, 0, 10).instance_at([(0, 0), (20, 0)]).scale(10, origin=(0, 0))
+        simplified = instanced.simplify_for_output(0.1)
+
+        self.assertIsNotNone(simplified.instances())
+        self.assertLess(instanced.geoms.hausdorff_distance(simplified.geoms), 0.1)
+
+    def test_with_precision(self):
+        square = Group.rect(0, 0, 10, 10)
+        nearly = Group.rect(1e-9, 0, 10, 10)
+
+        self.assertEqual(1, len(square.difference(nearly).geoms.geoms))
+
+        precise = square.with_precision(0.001)
+        self.assertEqual(0, len(precise.difference(nearly).geoms.geoms))
+        self.assertEqual(0, len(precise.translate(0.0004, 0).difference(nearly).geoms.geoms))
+
+        union = precise.add(Group.rect(10 + 1e-7, 0, 5, 5)).union()
+        self.assertEqual(1, len(union.geoms.geoms))
+        self.assertEqual(0.001, union._precision)
+
+        # parts collapsing onto the grid are dropped along with their attributes
+        collapsed = Group.rect(0, 0, 1e-4, 1).add(Group.rect(2, 2, 1, 1).add_geom_attribute("a", 1))\
+            .with_precision(0.001)
+        self.assertEqual(1, len(collapsed.geoms.geoms))
+        self.assertDictEqual({0: {"a": 1}}, dict(collapsed.geom_attributes_manager.attributes))
+
+        with self.assertRaises(ValueError):
+            square.with_precision(0)
+
+    def test_from_text(self):
+        outlined = []
+
+        # draws each character as a box as wide as its position in the alphabet,
+        # advancing by half a unit more
+        class Context:
+            def __init__(self, surface):
+                self.width = 0
+
+            def select_font_face(self, font_face, font_slant, font_weight):
+                pass
+
+            def set_font_size(self, font_size):
+                pass
+
+            def move_to(self, x, y):
+                pass
+
+            def text_path(self, char):
+                outlined.append(char)
+                self.width = ord(char) - ord("a") + 1
+
+            def get_current_point(self):
+                return self.width + 0.5, 0
+
+            def copy_path_flat(self):
+                return [(0, (0, 0)), (1, (self.width, 0)), (1, (self.width, -1)), (1, (0, -1)), (3, ())]
+
+        cairo = types.SimpleNamespace(
+            SVGSurface=lambda *args: Mock(),
+            Context=Context,
+            PathDataType=types.SimpleNamespace(MOVE_TO=0, LINE_TO=1, CLOSE_PATH=3),
+            FontSlant=types.SimpleNamespace(NORMAL=0),
+            FontWeight=types.SimpleNamespace(NORMAL=0))
+
+        _glyph_outline.cache_clear()
+
+        try:
+            with patch.dict(sys.modules, {"cairo": cairo}):
+                text = Group.from_text("abab", "Font", 10)
+                Group.from_text("ba", "Font", 10)
+        finally:
+            _glyph_outline.cache_clear()
+
+        self.assertListEqual([(0, -1, 1, 0), (1.5, -1, 3.5, 0), (4, -1, 5, 0), (5.5, -1, 7.5, 0)],
+                             [g.bounds for g in text.geoms.geoms])
+
+        # each character is only outlined once
+        self.assertListEqual(["a", "b"], outlined)
+
+    def test_prepared_filters(self):
+        container = Group.circle(0, 0, 20)
+        g = Group.rect_centered(0, 0, 1, 1).linarray(4, lambda i, g: g.translate(i * 5, 0).add_geom_attribute("i", i))
+
+        within = g.filter_within(container)
+        self.assertEqual(2, len(within.geoms.geoms))
+        self.assertDictEqual({0: {"i": 0}, 1: {"i": 1}}, dict(within.geom_attributes_manager.attributes))
+        self.assertTrue(within.geoms.equals(g.filter(lambda p: container.covers(p)).geoms))
+
+        self.assertEqual(3, len(g.filter_intersecting(container).geoms.geoms))
+        self.assertDictEqual({0: {"i": 3}}, dict(g.filter_disjoint(container).geom_attributes_manager.attributes))
+
+        sizes = Group.rect(0, 0, 1, 1).add(Group.rect(0, 0, 2, 2)).add(Group.rect(0, 0, 3, 3))
+        self.assertEqual(4, sizes.filter_by_area(min_area=2, max_area=5).area)
+
+    def test_group_builder(self):
+        builder = GroupBuilder()
+        builder.add(Group.rect(0, 0, 1, 1).add_geom_attribute("a", 0))
+        builder.add(Group.rect(2, 0, 1, 1))
+        builder.add(Group.rect(4, 0, 1, 1).add_geom_attribute("a", 2))
+
+        built = builder.build()
+
+        self.assertEqual(3, len(built.geoms.geoms))
+        self.assertDictEqual({0: {"a": 0}, 2: {"a": 2}}, dict(built.geom_attributes_manager.attributes))
+
+    def test_group_builder_infers_type(self):
+        lines = GroupBuilder().add(Group()).add(Group.line(0, 0, 1, 1)).build()
+
+        self.assertEqual(shapely.geometry.MultiLineString, lines.type)
+
+    def test_linarray(self):
+        g = Group.rect(0, 0, 1, 1).add_geom_attribute("a", 0)\
+            .linarray(4, lambda i, g: g.translate(i * 2, 0))
+
+        self.assertEqual(4, len(g.geoms.geoms))
+        self.assertEqual(7, g.bounds_width)
+        self.assertEqual(4, len(dict(g.geom_attributes_manager.attributes)))
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import unittest
+
+from shart import profiling
+from shart.group import Group
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_profile(self):
+        rect = Group.rect(0, 0, 10, 10)
+
+        # not recorded
+        rect.translate(1, 1)
+
+        with profiling.profile() as p:
+            self.assertTrue(profiling.is_profiling())
+            rect.spin(0, 0, 4).union()
+            rect.translate(1, 1).translate(1, 1)
+
+        self.assertFalse(profiling.is_profiling())
+
+        stats = p.stats()
+        self.assertEqual(2, stats["Group.translate"]["calls"])
+
+        spin = stats["Group.spin"]
+        self.assertEqual(1, spin["calls"])
+        self.assertEqual(1, spin["parts_in"])
+        self.assertEqual(5, spin["vertices_in"])
+        self.assertEqual(4, spin["parts_out"])
+        self.assertEqual(20, spin["vertices_out"])
+
+        self.assertIn("Group.union", p.summary())
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "trace.json")
+            p.write_trace(file_path)
+
+            with open(file_path) as f:
+                events = json.load(f)["traceEvents"]
+
+        self.assertEqual(len(p.events), len(events))
+        self.assertEqual("X", events[0]["ph"])
+
+    def test_instances(self):
+        with profiling.profile() as p:
+            Group.rect(0, 0, 1, 1).instance_at([(0, 0), (2, 0), (4, 0)]).translate(1, 0)
+
+        stats = p.stats()
+        self.assertEqual(3, stats["Group.instance_at"]["parts_out"])
+        self.assertEqual(15, stats["Group.instance_at"]["vertices_out"])
+        self.assertEqual(3, stats["Group.translate"]["parts_in"])
+
+    def test_nested(self):
+        with profiling.profile(counts=False) as p:
+            Group.rect(0, 0, 10, 10).recurse(lambda g: [g.scale(0.5).add(g.translate(10, 0).scale(0.5))], 3)
+
+        stats = p.stats()
+        recurse = stats["Group.recurse"]
+
+        # nested calls are part of the enclosing call's time but not its self time
+        self.assertLessEqual(stats["Group.add"]["seconds"], recurse["seconds"])
+        self.assertLess(recurse["self_seconds"], recurse["seconds"])
+        self.assertEqual(0, recurse["vertices_in"])
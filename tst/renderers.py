@@ -0,0 +1,159 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from defusedxml import ElementTree as etree
+
+import shapely as sh
+import shapely.geometry
+
+from shart.group import Group
+from shart.renderers import GeometryRenderer, PrimitiveRenderer, RenderBuilder, SVGPrimitiveRenderer, \
+    StreamingSVGPrimitiveRenderer, svg_number, svg_numbers, svg_path_style
+
+
+# the shape of the documents cairo writes
+CAIRO_DOCUMENT = b'<?xml version="1.0" encoding="UTF-8"?>\n' \
+                 b'<svg xmlns="http://www.w3.org/2000/svg" width="10mm" height="10mm" viewBox="0 0 10 10">\n' \
+                 b'<g id="surface1">\n' \
+                 b'<rect x="0" y="0" width="10" height="10" style="fill:rgb(100%,100%,100%);"/>\n' \
+                 b'</g>\n' \
+                 b'</svg>\n'
+
+
+class TestRenderers(unittest.TestCase):
+
+    def test_svg_path_style(self):
+        self.assertEqual(
+            "fill:none;stroke-width:1;stroke-linecap:butt;stroke-linejoin:miter;stroke:rgb(0%,0%,0%);"
+            "stroke-opacity:1;stroke-miterlimit:10;", svg_path_style())
+        self.assertEqual(
+            " stroke:none;fill-rule:evenodd;fill:rgb(100%,50%,0%);fill-opacity:0.75;",
+            svg_path_style((1, 0.5, 0, 0.75), True))
+
+    def test_svg_numbers(self):
+        values = np.array([[0.0, -0.0], [-1e-9, 100], [10.5, -3.25], [4e-7, 1e6]])
+
+        self.assertListEqual([svg_number(v) for v in values.ravel()], svg_numbers(values))
+        self.assertListEqual(["0", "0", "0", "100", "10.5", "-3.25", "0", "1000000"], svg_numbers(values))
+
+    def test_path_points(self):
+        class PointRecorder(PrimitiveRenderer):
+            def __init__(self):
+                self.points = []
+
+            def path_point(self, x0, y0):
+                self.points.append((x0, y0))
+
+        # backends without path_points draw a point at a time
+        recorder = PointRecorder()
+        recorder.path_points(np.array([[1, 2], [3.5, 4]]))
+        self.assertListEqual([(1, 2), (3.5, 4)], recorder.points)
+
+        streaming = StreamingSVGPrimitiveRenderer("unused.svg", 10, 10)
+        streaming.start_path(0, 0)
+        streaming.path_points(np.array([[1, 2], [3.5, -4]]))
+        streaming.path_points(np.empty((0, 2)))
+        streaming.close_path()
+        self.assertEqual("M 0 0 L 1 2 L 3.5 -4 Z", " ".join(streaming._path))
+
+    def test_simplify_tolerance(self):
+        self.assertEqual(0.01, RenderBuilder().units_mm().simplify()._get_simplify_tolerance())
+        self.assertEqual(0.02, RenderBuilder().units_mm().simplify(kerf=0.2)._get_simplify_tolerance())
+        self.assertEqual(0.5, RenderBuilder().simplify(tolerance=0.5, kerf=0.2)._get_simplify_tolerance())
+
+        with self.assertRaises(ValueError):
+            RenderBuilder().units("em").simplify()._get_simplify_tolerance()
+
+    def test_instances(self):
+        group = Group.rect(0, 0, 1, 1).instance_at([(1, 1), (3, 1)])
+        template, matrices = group.instances()
+
+        primitive_renderer = SVGPrimitiveRenderer("unused.svg", 10, 10)
+        GeometryRenderer(-group.bounds_x, -group.bounds_y).render_instances(
+            template, matrices, primitive_renderer, [{"color": (0, 0, 0), "fill": True}], "instance")
+
+        modifier = primitive_renderer._svg_file_modifier
+        modifier.write(CAIRO_DOCUMENT)
+        document = modifier.get_modified_contents()
+
+        self.assertIn('d="M 1 0 L 1 1 L 0 1 L 0 0 L 1 0 Z"', document)
+        self.assertIn('href="#instance" transform="matrix(1,0,0,1,0,0)"', document)
+        self.assertIn('transform="matrix(1,0,0,1,2,0)"', document)
+        self.assertLess(document.index("defs"), document.index('id="surface"'))
+
+
+    def test_streaming_svg(self):
+        ring = Group.circle(0, 0, 10).difference(Group.circle(0, 0, 5))\
+            .add_geom_attribute("fill", True)\
+            .add_geom_attribute("color", (1, 0, 0))
+        line = Group.line(0, 0, 10, 0)
+        squares = Group.rect(0, 0, 1, 1).instance_at([(20, 0), (22, 0)])
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "streamed")
+
+            ring.do(RenderBuilder().svg(streaming=True).units_mm().file(file_path))
+            line.do(RenderBuilder().svg(streaming=True).file(file_path + "-line"))
+            squares.do(RenderBuilder().svg(streaming=True).fill_background(False).file(file_path + "-instances"))
+
+            tree = etree.parse(file_path + ".svg").getroot()
+            line_tree = etree.parse(file_path + "-line.svg").getroot()
+            instances_tree = etree.parse(file_path + "-instances.svg").getroot()
+
+        namespace = "{http://www.w3.org/2000/svg}"
+
+        self.assertEqual("10mm", tree.attrib["width"])
+        self.assertEqual("0 0 10 10", tree.attrib["viewBox"])
+
+        paths = list(tree.iter(namespace + "path"))
+        self.assertEqual(1, len(paths))
+        self.assertEqual(svg_path_style((1, 0, 0), True), paths[0].attrib["style"])
+        self.assertEqual(2, paths[0].attrib["d"].count("M"))
+        self.assertTrue(paths[0].attrib["d"].endswith("Z"))
+        self.assertEqual(1, len(list(tree.iter(namespace + "rect"))))
+
+        self.assertEqual("10pt", line_tree.attrib["width"])
+        self.assertEqual(["M 0 0 L 10 0"], [p.attrib["d"] for p in line_tree.iter(namespace + "path")])
+
+        self.assertEqual(1, len(list(instances_tree.iter(namespace + "path"))))
+        uses = list(instances_tree.iter(namespace + "use"))
+        self.assertListEqual(["matrix(1,0,0,1,0,0)", "matrix(1,0,0,1,2,0)"], [u.attrib["transform"] for u in uses])
+        self.assertEqual("#instance", uses[0].attrib["{http://www.w3.org/1999/xlink}href"])
+
+    def test_failed_render(self):
+        def fail(geometry_renderer, primitive_renderer):
+            raise ValueError("failed")
+
+        with tempfile.TemporaryDirectory() as directory:
+            builder = RenderBuilder().svg(streaming=True).post_render_callback(fail).file(os.path.join(directory, "failed"))
+
+            with self.assertRaises(ValueError):
+                Group.rect(0, 0, 1, 1).do(builder)
+
+            # no partial output is left behind
+            self.assertListEqual([], os.listdir(directory))
+
+    def test_coloured_instances(self):
+        rosette = Group.rect(10, 0, 2, 1).spin(0, 0, 36, should_rotate=True, instanced=True)\
+            .add_geom_attribute("color", (1, 0, 0))
+
+        self.assertIsNotNone(rosette._instances)
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "rosette")
+            rosette.do(RenderBuilder().svg(streaming=True).file(file_path))
+
+            tree = etree.parse(file_path + ".svg").getroot()
+
+        namespace = "{http://www.w3.org/2000/svg}"
+
+        paths = list(tree.iter(namespace + "path"))
+        self.assertEqual(1, len(paths))
+        self.assertEqual(svg_path_style((1, 0, 0)), paths[0].attrib["style"])
+        self.assertEqual(36, len(list(tree.iter(namespace + "use"))))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+import shapely as sh
+import shapely.geometry
+
+from shart.group import Group
+
+
+class TestSerialization(unittest.TestCase):
+
+    def _group(self):
+        return Group.rect(0, 0, 1, 1).add_geom_attribute("color", (1, 0, 0))\
+            .add(Group.rect(2, 0, 1, 1))\
+            .add(Group.circle(5, 0, 2).add_geom_attribute("fill", True).add_geom_attribute("n", 2))
+
+    def test_round_trip(self):
+        group = self._group()
+        loaded = Group.from_bytes(group.to_bytes())
+
+        self.assertTrue(group.geoms.equals_exact(loaded.geoms, 0))
+        self.assertDictEqual(dict(group.geom_attributes_manager.attributes), dict(loaded.geom_attributes_manager.attributes))
+
+        lines = Group.line(0, 0, 1, 1).add_geom_attribute("color", (0, 0, 1, 0.5))
+        loaded_lines = Group.from_bytes(lines.to_bytes())
+
+        self.assertEqual(sh.geometry.MultiLineString, loaded_lines.type)
+        self.assertEqual((0, 0, 1, 0.5), loaded_lines.geom_attributes_manager.get_geom_attribute(0, "color"))
+
+    def test_columnar_round_trip(self):
+        group = self._group().with_columnar_attributes()
+        loaded = Group.from_bytes(group.to_bytes())
+
+        self.assertIs(type(group.geom_attributes_manager), type(loaded.geom_attributes_manager))
+        self.assertDictEqual(dict(group.geom_attributes_manager.attributes), dict(loaded.geom_attributes_manager.attributes))
+
+    def test_precision(self):
+        group = self._group().with_precision(0.001)
+
+        self.assertEqual(0.001, Group.from_bytes(group.to_bytes())._precision)
+        self.assertIsNone(Group.from_bytes(self._group().to_bytes())._precision)
+        self.assertNotEqual(group.to_bytes(), group.with_precision(None).to_bytes())
+
+    def test_file(self):
+        group = self._group()
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "group.shart")
+            group.to_file(file_path)
+
+            self.assertTrue(group.geoms.equals_exact(Group.from_file(file_path).geoms, 0))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Group.from_bytes(b"not a group")
+
+        with self.assertRaises(ValueError):
+            Group.from_bytes(self._group().to_bytes()[:-1])
+
+        with self.assertRaises(ValueError):
+            Group.rect(0, 0, 1, 1).add_geom_attribute("f", lambda: None).to_bytes()
+
+
+if __name__ == "__main__":
+    unittest.main()
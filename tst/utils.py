@@ -3,6 +3,7 @@ from unittest.mock import Mock, MagicMock
 
 import shapely as sh
 import shapely.geometry
+import shapely.affinity
 
 import shart
 from shart.group import Group
@@ -32,6 +33,48 @@ class TestUtils(unittest.TestCase):
             sh.geometry.LineString([ (3, 3), (3, 2) ]),
             shart.utils.get_interpolated_segment(mls, l0.length + l1.length + 0.1 * l2.length))
 
+    def test_circular_array(self):
+        geom = sh.geometry.box(10, 0, 12, 1)
+
+        copies = shart.utils.circular_array(sh.geometry.Point(0, 0), geom, 4, should_rotate=True)
+
+        self.assertEqual(4, len(copies))
+        self.assertTrue(copies[1].equals(sh.geometry.box(-1, 10, 0, 12)))
+
+        points = shart.utils.circular_array(sh.geometry.Point(0, 0), sh.geometry.Point(1, 0), 4, should_rotate=True)
+        self.assertTrue(points[1].equals_exact(sh.geometry.Point(0, 1), 1e-9))
+
+        collection = sh.geometry.GeometryCollection([sh.geometry.Point(1, 0), sh.geometry.LineString([(1, 0), (2, 0)])])
+        copies = shart.utils.circular_array(sh.geometry.Point(0, 0), collection, 2, should_rotate=True)
+        self.assertTrue(copies[1].equals(sh.affinity.rotate(collection, 180, origin=(0, 0))))
+
+    def test_affine_copies(self):
+        geom = sh.geometry.box(0, 0, 2, 2).difference(sh.geometry.box(0.5, 0.5, 1, 1))
+
+        copies = shart.utils.affine_copies([geom], [
+            shart.utils.translation_affine(1, 2),
+            shart.utils.scale_affine(2, 2, 0, 0)])
+
+        self.assertTrue(copies[0][0].equals(sh.affinity.translate(geom, 1, 2)))
+        self.assertTrue(copies[1][0].equals(sh.affinity.scale(geom, 2, 2, origin=(0, 0))))
+
+    def test_circle_segment_count(self):
+        self.assertEqual(4, shart.utils.circle_segment_count(1, 2))
+        self.assertEqual(8, shart.utils.circle_segment_count(1, 0.1))
+
+        with self.assertRaises(ValueError):
+            shart.utils.circle_segment_count(1, 0)
+
+    def test_geom_key(self):
+        line = sh.geometry.LineString([(0, 0), (1, 0), (1, 1)])
+
+        self.assertEqual(shart.utils.geom_key(line, 1e-6), shart.utils.geom_key(sh.geometry.LineString(line.coords[::-1]), 1e-6))
+        self.assertNotEqual(shart.utils.geom_key(line, 1e-6), shart.utils.geom_key(sh.affinity.translate(line, 0.1), 1e-6))
+        self.assertEqual(shart.utils.geom_key(line, 1), shart.utils.geom_key(sh.affinity.translate(line, 0.1), 1))
+
+        box = sh.geometry.box(0, 0, 1, 1)
+        self.assertEqual(shart.utils.geom_key(box, 1e-6), shart.utils.geom_key(sh.geometry.polygon.orient(box, -1), 1e-6))
+
     def _assert_line_equals(self, l0, l1):
         self.assertEqual(list(l0.coords), list(l1.coords))
 